@@ -107,6 +107,7 @@ def process_video(video_storage_folder, file, dubbing=False, is_retry=False, sav
                         border_style="red"
                     )
                     console.print(error_panel)
+                    multi_target.cancel_extra_targets()
                     cleanup(ERROR_OUTPUT_DIR)
                     return False, current_step, str(e)
                 console.print(Panel(
@@ -164,10 +165,13 @@ def split_sentences():
 
 def summarize_and_translate():
     step4_1_summarize.get_summary()
+    multi_target.start_extra_targets()
     step4_2_translate_all.translate_all()
 
 def process_and_align_subtitles():
     step5_splitforsub.split_for_sub_main()
+    # the extra languages count towards this video's time and cost
+    multi_target.wait_extra_targets()
     step6_generate_final_timeline.align_timestamp_main()
 
 def gen_audio_tasks():
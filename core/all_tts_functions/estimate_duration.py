@@ -1,21 +1,72 @@
 import syllables
 from pypinyin import pinyin, Style
-from g2p_en import G2p
 from typing import Optional
+from functools import lru_cache
+import numpy as np
 import re
 
+# Patterns are compiled once, language detection tries them in this order
+LANG_PATTERNS = {
+    'zh': re.compile(r'[\u4e00-\u9fff]'), 'ja': re.compile(r'[\u3040-\u309f\u30a0-\u30ff]'),
+    'fr': re.compile(r'[àâçéèêëîïôùûüÿœæ]'), 'es': re.compile(r'[áéíóúñ¿¡]'), 'en': re.compile(r'[a-zA-Z]+'),
+    'ko': re.compile(r'[\uac00-\ud7af\u1100-\u11ff]')}
+ZH_NON_HAN = re.compile(r'[^\u4e00-\u9fff]')
+JA_YOON = re.compile(r'[きぎしじちぢにひびぴみり][ょゅゃ]')
+JA_SILENT = re.compile(r'[っー]')
+JA_MORA = re.compile(r'[\u3040-\u309f\u30a0-\u30ff\u4e00-\u9fff]')
+FR_SILENT_E = re.compile(r'e\b')
+VOWEL_GROUPS = {'fr': re.compile('[aeiouyàâéèêëîïôùûüÿœæ]+'), 'es': re.compile('[aeiouáéíóúü]+')}
+KO_SYLLABLE = re.compile(r'[\uac00-\ud7af]')
+MID_PUNCT, END_PUNCT, SPACE = r'[，；：,;、]+', r'[。！？.!?]+', r'\s+'
+SEGMENT_SPLIT = re.compile(f"({SPACE}|{MID_PUNCT}|{END_PUNCT})")
+SPACE_PATTERN = re.compile(SPACE)
+PAUSE_PATTERN = re.compile(f"{MID_PUNCT}|{END_PUNCT}")
+
+G2P_EN = None
+
+@lru_cache(maxsize=65536)
+def detect_language(text: str) -> str:
+    for lang, pattern in LANG_PATTERNS.items():
+        if pattern.search(text): return lang
+    return 'en'
+
+def get_g2p_en():
+    """G2p loads a neural model and may download NLTK data, it is only needed for words `syllables` cannot handle"""
+    global G2P_EN
+    if G2P_EN is None:
+        from g2p_en import G2p
+        G2P_EN = G2p()
+    return G2P_EN
+
+@lru_cache(maxsize=65536)
+def count_word_syllables(word: str) -> int:
+    try:
+        return syllables.estimate(word)
+    except:
+        phones = get_g2p_en()(word)
+        return max(1, len([p for p in phones if any(c in p for c in 'aeiou')]))
+
+@lru_cache(maxsize=65536)
+def estimate_mixed_text(text: str) -> float:
+    """Raw duration of a mixed-language sentence, memoized by text for all estimators since they share the default parameters.
+    Differences between voices are applied on top by `calibrate`."""
+    return AdvancedSyllableEstimator().process_mixed_text(text)['estimated_duration']
+
 class AdvancedSyllableEstimator:
     def __init__(self):
-        self.g2p_en = G2p()
         self.duration_params = {'en': 0.225, 'zh': 0.21, 'ja': 0.21, 'fr': 0.22, 'es': 0.22, 'ko': 0.21, 'default': 0.22}
-        self.lang_patterns = {
-            'zh': r'[\u4e00-\u9fff]', 'ja': r'[\u3040-\u309f\u30a0-\u30ff]',
-            'fr': r'[àâçéèêëîïôùûüÿœæ]', 'es': r'[áéíóúñ¿¡]', 'en': r'[a-zA-Z]+', 'ko': r'[\uac00-\ud7af\u1100-\u11ff]'}
+        self.lang_patterns = LANG_PATTERNS
         self.lang_joiners = {'zh': '', 'ja': '', 'en': ' ', 'fr': ' ', 'es': ' ', 'ko': ' '}
         self.punctuation = {
-            'mid': r'[，；：,;、]+', 'end': r'[。！？.!?]+', 'space': r'\s+',
+            'mid': MID_PUNCT, 'end': END_PUNCT, 'space': SPACE,
             'pause': {'space': 0.15, 'default': 0.1}
         }
+        # (scale, offset) learned from real TTS output, see speech_rate.py
+        self.calibration = (1.0, 0.0)
+
+    @property
+    def g2p_en(self):
+        return get_g2p_en()
 
     def estimate_duration(self, text: str, lang: Optional[str] = None) -> float:
         syllable_count = self.count_syllables(text, lang)
@@ -25,41 +76,27 @@ class AdvancedSyllableEstimator:
         if not text.strip(): return 0
         lang = lang or self._detect_language(text)
         
-        vowels_map = {
-            'fr': 'aeiouyàâéèêëîïôùûüÿœæ',
-            'es': 'aeiouáéíóúü'
-        }
-        
         if lang == 'en':
             return self._count_english_syllables(text)
         elif lang == 'zh':
-            text = re.sub(r'[^\u4e00-\u9fff]', '', text)
+            text = ZH_NON_HAN.sub('', text)
             return len(pinyin(text, style=Style.NORMAL))
         elif lang == 'ja':
-            text = re.sub(r'[きぎしじちぢにひびぴみり][ょゅゃ]', 'X', text)
-            text = re.sub(r'[っー]', '', text)
-            return len(re.findall(r'[\u3040-\u309f\u30a0-\u30ff\u4e00-\u9fff]', text))
+            text = JA_YOON.sub('X', text)
+            text = JA_SILENT.sub('', text)
+            return len(JA_MORA.findall(text))
         elif lang in ('fr', 'es'):
-            text = re.sub(r'e\b', '', text.lower()) if lang == 'fr' else text.lower()
-            return max(1, len(re.findall(f'[{vowels_map[lang]}]+', text)))
+            text = FR_SILENT_E.sub('', text.lower()) if lang == 'fr' else text.lower()
+            return max(1, len(VOWEL_GROUPS[lang].findall(text)))
         elif lang == 'ko':
-            return len(re.findall(r'[\uac00-\ud7af]', text))
+            return len(KO_SYLLABLE.findall(text))
         return len(text.split())
 
     def _count_english_syllables(self, text: str) -> int:
-        total = 0
-        for word in text.strip().split():
-            try:
-                total += syllables.estimate(word)
-            except:
-                phones = self.g2p_en(word)
-                total += max(1, len([p for p in phones if any(c in p for c in 'aeiou')]))
-        return max(1, total)
+        return max(1, sum(count_word_syllables(word) for word in text.strip().split()))
 
     def _detect_language(self, text: str) -> str:
-        for lang, pattern in self.lang_patterns.items():
-            if re.search(pattern, text): return lang
-        return 'en'
+        return detect_language(text)
 
     def process_mixed_text(self, text: str) -> dict:
         if not text or not isinstance(text, str):
@@ -72,19 +109,19 @@ class AdvancedSyllableEstimator:
             }
             
         result = {'language_breakdown': {}, 'total_syllables': 0, 'punctuation': [], 'spaces': []}
-        segments = re.split(f"({self.punctuation['space']}|{self.punctuation['mid']}|{self.punctuation['end']})", text)
+        segments = SEGMENT_SPLIT.split(text)
         total_duration = 0
         
         for i, segment in enumerate(segments):
             if not segment: continue
             
-            if re.match(self.punctuation['space'], segment):
+            if SPACE_PATTERN.match(segment):
                 prev_lang = self._detect_language(segments[i-1]) if i > 0 else None
                 next_lang = self._detect_language(segments[i+1]) if i < len(segments)-1 else None
                 if prev_lang and next_lang and (self.lang_joiners[prev_lang] == '' or self.lang_joiners[next_lang] == ''):
                     result['spaces'].append(segment)
                     total_duration += self.punctuation['pause']['space']
-            elif re.match(f"{self.punctuation['mid']}|{self.punctuation['end']}", segment):
+            elif PAUSE_PATTERN.match(segment):
                 result['punctuation'].append(segment)
                 total_duration += self.punctuation['pause']['default']
             else:
@@ -102,6 +139,28 @@ class AdvancedSyllableEstimator:
         result['estimated_duration'] = total_duration
         
         return result
+
+    def estimate_text(self, text: str) -> float:
+        """Duration of a mixed-language sentence, memoized because subtitles are estimated again in several steps"""
+        return estimate_mixed_text(text)
+
+    def calibrate(self, scale: float = 1.0, offset: float = 0.0):
+        self.calibration = (scale, offset)
+
+    def apply_calibration(self, durations):
+        """Map raw estimates onto the durations the TTS voice actually produces, empty texts stay 0"""
+        scale, offset = self.calibration
+        durations = np.asarray(durations, dtype=np.float64)
+        return np.where(durations > 0, np.maximum(scale * durations + offset, 0), 0)
+
+    def estimate_many(self, texts, lang: Optional[str] = None, raw: bool = False) -> np.ndarray:
+        """Durations of a whole column at once, each distinct text is estimated only once.
+        Without `lang` every text is treated as mixed-language like `estimate_duration(text, estimator)`."""
+        texts = list(texts)
+        estimate = self.estimate_text if lang is None else (lambda text: self.estimate_duration(text, lang))
+        durations = {text: estimate(text) for text in dict.fromkeys(text for text in texts if isinstance(text, str) and text)}
+        durations = np.array([durations.get(text, 0) if isinstance(text, str) else 0 for text in texts], dtype=np.float64)
+        return durations if raw else self.apply_calibration(durations)
     
 def init_estimator():
     return AdvancedSyllableEstimator()
@@ -109,7 +168,37 @@ def init_estimator():
 def estimate_duration(text: str, estimator: AdvancedSyllableEstimator):
     if not text or not isinstance(text, str):
         return 0
-    return estimator.process_mixed_text(text)['estimated_duration']
+    return float(estimator.apply_calibration(estimator.estimate_text(text)))
+
+def benchmark(n_lines=10000):
+    """Per-line estimation against `estimate_many` on a synthetic script"""
+    import time, random
+    random.seed(0)
+    words = ("the weather is nice today so we went to the park and talked about machine learning models "
+             "你好 世界 这是 一个 测试 我们 需要 在 输出 中 体现 空格 的 停顿 时间 "
+             "가을 나뭇잎이 부드럽게 떨어지는 생생한 색깔을").split()
+    script = [' '.join(random.choices(words, k=random.randint(3, 15))) + random.choice(['.', ',', '!', '?', '。']) for _ in range(n_lines)]
+    # a real script repeats many short lines
+    script += random.choices(script, k=n_lines // 5)
+
+    estimator = init_estimator()
+    start = time.time()
+    per_line = [estimator.process_mixed_text(text)['estimated_duration'] for text in script]
+    per_line_time = time.time() - start
+
+    # start the batch run cold as well
+    for cached in (detect_language, count_word_syllables, estimate_mixed_text):
+        cached.cache_clear()
+    estimator = init_estimator()
+    start = time.time()
+    batch = estimator.estimate_many(script)
+    batch_time = time.time() - start
+    start = time.time()
+    estimator.estimate_many(script)
+    warm_time = time.time() - start
+
+    assert np.allclose(per_line, batch)
+    print(f"{len(script)} lines: per line {per_line_time:.3f}s, estimate_many {batch_time:.3f}s, warm cache {warm_time:.3f}s")
 
 # 使用示例
 if __name__ == "__main__":
@@ -136,4 +225,6 @@ if __name__ == "__main__":
         for lang, info in result['language_breakdown'].items():
             print(f"- {lang}: {info['syllables']} syllables ({info['text']})")
         print(f"Punctuation: {result['punctuation']}")
-        print(f"Spaces: {result['spaces']}")
\ No newline at end of file
+        print(f"Spaces: {result['spaces']}")
+
+    benchmark()
@@ -0,0 +1,122 @@
+import os, sys, json
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+from threading import Lock
+import numpy as np
+from rich.console import Console
+from rich.panel import Panel
+from core.config_utils import load_key
+from core.all_tts_functions.estimate_duration import init_estimator
+
+console = Console()
+
+SPEECH_RATE_FILE = 'speech_rate.json'
+# A voice is calibrated only after this many generated lines
+MIN_SAMPLES = 20
+# Older runs are scaled down beyond this many lines so the fit follows changes of the voice or the TTS service
+MAX_SAMPLES = 2000
+# Raw estimates are never stretched or squeezed beyond these factors
+SCALE_RANGE = (0.5, 2.0)
+# Length of the placeholder audio tts_main writes for empty or failed lines
+SILENT_DURATION = 0.1
+
+SPEECH_RATE_LOCK = Lock()
+
+def get_voice():
+    """Voice setting of the current TTS method"""
+    tts_method = load_key("tts_method")
+    if tts_method in ('openai_tts', 'azure_tts', 'edge_tts'):
+        return load_key(f"{tts_method}.voice")
+    if tts_method in ('fish_tts', 'gpt_sovits'):
+        return load_key(f"{tts_method}.character")
+    if tts_method == 'sf_fish_tts':
+        mode = load_key("sf_fish_tts.mode")
+        return {'preset': load_key("sf_fish_tts.voice"), 'custom': load_key("sf_fish_tts.voice_id")}.get(mode, mode)
+    return 'default'
+
+def get_speech_rate_key():
+    return f'{load_key("tts_method")}|{get_voice()}|{load_key("target_language")}'
+
+class SpeechRateModel:
+    """Per-voice linear fit real_dur = scale * est_dur + offset, kept as running sums so it updates with every run"""
+
+    def __init__(self, path):
+        self.path = path
+        self.stats = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.stats = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                console.print(f"[yellow]⚠️ Ignoring unreadable speech rate file {path}: {e}[/yellow]")
+
+    def add(self, key, estimated, real):
+        estimated, real = np.asarray(estimated, dtype=np.float64), np.asarray(real, dtype=np.float64)
+        stats = self.stats.get(key, {'n': 0, 'sx': 0, 'sy': 0, 'sxx': 0, 'sxy': 0})
+        # forget older runs proportionally instead of letting them outweigh the newest audio forever
+        decay = min(1.0, MAX_SAMPLES / (stats['n'] + len(estimated))) if len(estimated) else 1.0
+        self.stats[key] = {
+            'n': stats['n'] * decay + len(estimated),
+            'sx': stats['sx'] * decay + float(estimated.sum()),
+            'sy': stats['sy'] * decay + float(real.sum()),
+            'sxx': stats['sxx'] * decay + float((estimated ** 2).sum()),
+            'sxy': stats['sxy'] * decay + float((estimated * real).sum()),
+        }
+
+    def get_coef(self, key):
+        """(scale, offset) of a voice, or None while it has too few samples"""
+        stats = self.stats.get(key)
+        if not stats or stats['n'] < MIN_SAMPLES or stats['sx'] <= 0:
+            return None
+        n, sx, sy, sxx, sxy = stats['n'], stats['sx'], stats['sy'], stats['sxx'], stats['sxy']
+        variance = n * sxx - sx ** 2
+        # lines of nearly equal length cannot separate scale from offset, fall back to a pure ratio
+        scale = (n * sxy - sx * sy) / variance if variance > 1e-6 * n * sxx else sy / sx
+        scale = min(max(scale, SCALE_RANGE[0]), SCALE_RANGE[1])
+        return scale, (sy - scale * sx) / n
+
+    def save(self):
+        with SPEECH_RATE_LOCK:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.stats, f, ensure_ascii=False, indent=2)
+
+def load_speech_rate_model():
+    return SpeechRateModel(os.path.join(load_key("model_dir"), SPEECH_RATE_FILE))
+
+def init_calibrated_estimator():
+    """Duration estimator corrected with the speech rate learned for the current voice"""
+    estimator = init_estimator()
+    if load_key("speech_rate_calibration"):
+        coef = load_speech_rate_model().get_coef(get_speech_rate_key())
+        if coef:
+            estimator.calibrate(*coef)
+    return estimator
+
+def record_speech_rate(lines, real_durations):
+    """Learn from the duration of every generated TTS line and report how well the estimates matched"""
+    if not load_key("speech_rate_calibration"):
+        return
+    estimator = init_calibrated_estimator()
+    raw = estimator.estimate_many(lines, raw=True)
+    calibrated = estimator.estimate_many(lines)
+    real = np.asarray(real_durations, dtype=np.float64)
+    # placeholder silence says nothing about the voice
+    valid = (raw > 0) & (real > SILENT_DURATION)
+    if not valid.any():
+        return
+
+    key = get_speech_rate_key()
+    model = load_speech_rate_model()
+    model.add(key, raw[valid], real[valid])
+    model.save()
+    coef = model.get_coef(key)
+    new_estimator = init_estimator()
+    if coef:
+        new_estimator.calibrate(*coef)
+    updated = new_estimator.estimate_many(np.asarray(lines, dtype=object)[valid])
+    error = lambda estimated: np.abs(estimated - real[valid]).mean()
+    status = f"scale {coef[0]:.3f}, offset {coef[1]:+.3f}s" if coef else f"collecting samples ({model.stats[key]['n']:.0f}/{MIN_SAMPLES})"
+    console.print(Panel(
+        f"{int(valid.sum())} lines of {key}: {status}\n"
+        f"Mean absolute error per line: uncalibrated {error(raw[valid]):.2f}s, this run {error(calibrated[valid]):.2f}s, updated {error(updated):.2f}s",
+        title="Speech Rate Calibration", border_style="cyan"))
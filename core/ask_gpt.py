@@ -1,6 +1,7 @@
 import os, sys, json
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from threading import Lock
+from contextlib import nullcontext
 import json_repair
 import json 
 from openai import OpenAI
@@ -11,6 +12,12 @@ from core.config_utils import load_key
 
 LOG_FOLDER = 'output/gpt_log'
 LOCK = Lock()
+# Semaphore shared with the processes of the extra target languages, caps the requests in flight across all of them
+LLM_SLOTS = None
+
+def set_llm_slots(slots):
+    global LLM_SLOTS
+    LLM_SLOTS = slots
 
 def save_log(model, prompt, response, log_title = 'default', message = None):
     os.makedirs(LOG_FOLDER, exist_ok=True)
@@ -79,7 +86,8 @@ def ask_gpt(prompt, response_json=True, valid_def=None, log_title='default'):
             if response_format is not None:
                 completion_args["response_format"] = response_format
                 
-            response = client.chat.completions.create(**completion_args)
+            with LLM_SLOTS or nullcontext():
+                response = client.chat.completions.create(**completion_args)
             
             if response_json:
                 try:
@@ -0,0 +1,70 @@
+import os, sys, time, heapq
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import concurrent.futures
+from threading import Lock
+from rich.console import Console
+
+console = Console()
+
+def make_job(key, fn, *args, cost=1, **kwargs):
+    """A unit of LLM work, `cost` is the estimated prompt + completion tokens"""
+    return {'key': key, 'fn': fn, 'args': args, 'kwargs': kwargs, 'cost': max(cost, 1)}
+
+def lpt_order(jobs):
+    """Longest-processing-time-first, so large items never land at the tail of the queue"""
+    return sorted(jobs, key=lambda job: -job['cost'])
+
+def simulate_makespan(costs, max_workers):
+    """Makespan of handing `costs` in order to the first free worker, in cost units"""
+    workers = [0] * max(1, min(max_workers, len(costs)))
+    for cost in costs:
+        heapq.heappush(workers, heapq.heappop(workers) + cost)
+    return max(workers) if costs else 0
+
+def run_scheduled(jobs, max_workers, step_name, on_done=None):
+    """Run jobs on a thread pool and return {key: result}, a free worker always takes the most expensive waiting job.
+    `jobs` may be a generator, the first jobs then run while the rest are still being prepared.
+    Prints the predicted makespan of LPT and of the file order next to the actual wall time."""
+    # jobs are fed in file order unless everything is known up front, then in LPT order
+    file_order_jobs = jobs if isinstance(jobs, list) else None
+    if file_order_jobs is not None:
+        jobs = lpt_order(jobs)
+    queue, queue_lock = [], Lock()
+    fed, durations = [], []
+    def run_next():
+        with queue_lock:
+            job = heapq.heappop(queue)[-1]
+        start = time.time()
+        result = job['fn'](*job['args'], **job['kwargs'])
+        durations.append(time.time() - start)
+        return job, result
+
+    results = {}
+    start = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for job in jobs:
+            with queue_lock:
+                heapq.heappush(queue, (-job['cost'], len(fed), job))
+            fed.append(job)
+            # one task per job, each one pops whatever is largest when a worker becomes free
+            futures.append(executor.submit(run_next))
+        for future in concurrent.futures.as_completed(futures):
+            job, result = future.result()
+            results[job['key']] = result
+            if on_done:
+                on_done(job, result)
+    if not fed:
+        return {}
+    actual = time.time() - start
+
+    # convert cost units to seconds with the throughput observed in this run
+    seconds_per_cost = sum(durations) / sum(job['cost'] for job in fed)
+    predicted = simulate_makespan([job['cost'] for job in lpt_order(fed)], max_workers) * seconds_per_cost
+    file_order = simulate_makespan([job['cost'] for job in (file_order_jobs or fed)], max_workers) * seconds_per_cost
+    console.print(f"[cyan]⏱️ {step_name}: {len(fed)} LLM jobs, predicted makespan {predicted:.1f}s (file order {file_order:.1f}s), actual {actual:.1f}s[/cyan]")
+    return results
+
+if __name__ == '__main__':
+    jobs = [make_job(i, time.sleep, cost / 100, cost=cost) for i, cost in enumerate([10, 20, 30, 200, 40, 50, 180])]
+    run_scheduled(jobs, max_workers=3, step_name='demo')
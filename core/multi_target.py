@@ -0,0 +1,116 @@
+import os, sys, re, shutil
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import multiprocessing
+import easy_util as eu
+from core.config_utils import load_key, yaml, CONFIG_PATH
+from core.ask_gpt import set_llm_slots
+from core import step4_1_summarize, step4_2_translate_all, step5_splitforsub, step6_generate_final_timeline
+from rich.console import Console
+from rich.panel import Panel
+
+console = Console()
+
+TARGETS_DIR = 'output/targets'
+# Everything a target language needs from the shared transcription, sentence splitting and terminology
+SHARED_FILES = ['output/log/cleaned_chunks.xlsx', 'output/log/sentence_splitbymeaning.txt', 'output/log/terminology.json', 'custom_terms.xlsx']
+# (manager, pool, {language: async result}, workspaces) of the languages being translated in the background
+EXTRA_TARGETS = None
+
+def get_workspace(target_language):
+    return os.path.join(TARGETS_DIR, re.sub(r'[\\/:*?"<>|\s]+', '_', target_language))
+
+def prepare_workspace(target_language):
+    """A folder that looks like the project root to the pipeline steps, with its own config and output"""
+    workspace = get_workspace(target_language)
+    os.makedirs(os.path.join(workspace, 'output', 'log'), exist_ok=True)
+    for file in SHARED_FILES:
+        if os.path.exists(file):
+            shutil.copy(file, os.path.join(workspace, file))
+
+    with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+        config = yaml.load(f)
+    config['target_language'] = target_language
+    # all languages feed the same translation memory
+    config['translation_memory']['path'] = os.path.abspath(config['translation_memory']['path'])
+    with open(os.path.join(workspace, CONFIG_PATH), 'w', encoding='utf-8') as f:
+        yaml.dump(config, f)
+    return workspace
+
+def translate_target(workspace):
+    """Runs in a worker process. The terms of the main language are shared, only their translations are redone."""
+    os.chdir(workspace)
+    eu.prompt_tokens = eu.completion_tokens = 0
+    step4_1_summarize.translate_terms()
+    step4_2_translate_all.translate_all()
+    step5_splitforsub.split_for_sub_main()
+    step6_generate_final_timeline.generate_subtitles()
+    return eu.prompt_tokens, eu.completion_tokens
+
+def get_extra_languages():
+    return [language for language in load_key("extra_target_languages") if language != load_key("target_language")]
+
+def start_extra_targets():
+    """Start translating into every extra target language in the background, each into `output/targets/<language>`.
+    Called once the terminology exists, so the extra languages run alongside the translation of the main one.
+    All languages share one budget of `max_workers` LLM requests in flight, the main language included."""
+    global EXTRA_TARGETS
+    languages = get_extra_languages()
+    if EXTRA_TARGETS is not None or not languages:
+        return
+    max_workers = load_key("max_workers")
+    workspaces = {language: prepare_workspace(language) for language in languages}
+    console.print(Panel(f"🌐 Translating into {', '.join(languages)} in the background, sharing {max_workers} LLM workers with {load_key('target_language')}", border_style="cyan"))
+
+    # the caller is a multithreaded Streamlit or batch process, forking it could copy locks held by other threads
+    context = multiprocessing.get_context('spawn')
+    manager = context.Manager()
+    slots = manager.BoundedSemaphore(max_workers)
+    set_llm_slots(slots)
+    pool = context.Pool(len(languages), initializer=set_llm_slots, initargs=(slots,))
+    results = {language: pool.apply_async(translate_target, (os.path.abspath(workspace),)) for language, workspace in workspaces.items()}
+    pool.close()
+    EXTRA_TARGETS = (manager, pool, results, workspaces)
+
+def stop_extra_targets(terminate):
+    """Release the worker processes and the shared LLM budget"""
+    global EXTRA_TARGETS
+    manager, pool = EXTRA_TARGETS[:2]
+    EXTRA_TARGETS = None
+    if terminate:
+        pool.terminate()
+    pool.join()
+    set_llm_slots(None)
+    manager.shutdown()
+
+def wait_extra_targets():
+    """Wait for the extra languages and add their tokens to the run, before the run summary is recorded.
+    Languages that were not started, e.g. when this step is retried, are translated now."""
+    if EXTRA_TARGETS is None:
+        start_extra_targets()
+    if EXTRA_TARGETS is None:
+        return
+    results, workspaces = EXTRA_TARGETS[2:]
+    failed = True
+    try:
+        for language, result in results.items():
+            prompt_tokens, completion_tokens = result.get()
+            with eu.lock:
+                eu.prompt_tokens += prompt_tokens
+                eu.completion_tokens += completion_tokens
+            console.print(f"[green]✅ Subtitles in {language} saved to `{workspaces[language]}/output`[/green]")
+        failed = False
+    finally:
+        # the other languages of a failed run are stopped instead of left running
+        stop_extra_targets(terminate=failed)
+
+def cancel_extra_targets():
+    """Stop the languages of a run that failed or was restarted"""
+    if EXTRA_TARGETS is not None:
+        stop_extra_targets(terminate=True)
+
+def translate_extra_targets():
+    start_extra_targets()
+    wait_extra_targets()
+
+if __name__ == '__main__':
+    translate_extra_targets()
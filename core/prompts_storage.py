@@ -30,6 +30,37 @@ Split the given subtitle text into {num_parts} parts, each less than {word_limit
 {sentence}
 </split_this_sentence>
 
+### Your Answer, Provide ONLY a valid JSON object:
+""".strip()
+    return split_prompt
+
+def get_batch_split_prompt(items, word_limit = 20):
+    """`items` is a list of (sentence, num_parts), answers are keyed by the item number"""
+    language = load_key("whisper.detected_language")
+    sentences = "\n".join(f'<sentence id="{i}" parts="{num_parts}">{sentence}</sentence>' for i, (sentence, num_parts) in enumerate(items, 1))
+    json_format = {str(i): {"split": "Complete sentence with [br] tags at split positions"} for i in range(1, len(items) + 1)}
+    split_prompt = f"""
+### Role
+You are a professional Netflix subtitle splitter in {language}.
+
+### Task
+Split each given subtitle text into the number of parts given by its `parts` attribute, each part less than {word_limit} words.
+
+### Instructions
+1. Maintain sentence meaning coherence according to Netflix subtitle standards
+2. Keep parts roughly equal in length (minimum 3 words each)
+3. Split at natural points like punctuation marks or conjunctions
+4. If provided text is repeated words, simply split at the middle of the repeated words.
+5. Handle every sentence independently and keep its text unchanged apart from the [br] tags
+
+### Output Format in JSON
+{json.dumps(json_format, indent=4)}
+
+### Given Texts
+<split_these_sentences>
+{sentences}
+</split_these_sentences>
+
 ### Your Answer, Provide ONLY a valid JSON object:
 """.strip()
     return split_prompt
@@ -107,10 +138,83 @@ Please output your analysis results in the following JSON format, where <> repre
 """.strip()
     return summary_prompt
 
+def get_summary_reduce_prompt(topics, terms):
+    src_lang = load_key("whisper.detected_language")
+    tgt_lang = load_key("target_language")
+    topics_text = '\n'.join(f"{i+1}. {topic}" for i, topic in enumerate(topics))
+    terms_json = json.dumps({"terms": terms}, ensure_ascii=False, indent=4)
+
+    reduce_prompt = f"""
+### Role
+You are a video translation expert and terminology consultant, specializing in {src_lang} comprehension and {tgt_lang} expression optimization.
+
+### Task
+The video text was analyzed in consecutive parts. Merge the partial results into one:
+1. Summarize the main topic of the whole video in two sentences based on the partial topics
+2. Merge the term lists: remove duplicates and keep one consistent {tgt_lang} translation for each term
+3. Keep every distinct term, do not invent new ones
+
+### Partial Topics
+{topics_text}
+
+### Partial Terms
+{terms_json}
+
+### Output Format
+Please output your results in the following JSON format, where <> represents placeholders:
+{{
+    "topic": "Two-sentence video summary",
+    "terms": [
+        {{
+            "src": "{src_lang} term",
+            "tgt": "{tgt_lang} translation or original",
+            "note": "Brief explanation"
+        }},
+        ...
+    ]
+}}
+""".strip()
+    return reduce_prompt
+
+def get_terms_translation_prompt(topic, terms):
+    src_lang = load_key("whisper.detected_language")
+    tgt_lang = load_key("target_language")
+    terms_json = json.dumps({"terms": [{"src": term["src"], "tgt": term["tgt"], "note": term["note"]} for term in terms]}, ensure_ascii=False, indent=4)
+
+    terms_prompt = f"""
+### Role
+You are a video translation expert and terminology consultant, specializing in {src_lang} comprehension and {tgt_lang} expression optimization.
+
+### Task
+The terms below were extracted from a {src_lang} video and translated into another language. Translate every term into {tgt_lang}:
+1. Replace "tgt" with the {tgt_lang} translation, or keep the original for abbreviations and proper nouns
+2. Keep "src" and "note" unchanged, keep every term and do not add new ones
+
+### Video Topic
+{topic}
+
+### Terms
+{terms_json}
+
+### Output Format
+Please output your results in the following JSON format, where <> represents placeholders:
+{{
+    "terms": [
+        {{
+            "src": "{src_lang} term",
+            "tgt": "{tgt_lang} translation or original",
+            "note": "Brief explanation"
+        }},
+        ...
+    ]
+}}
+""".strip()
+    return terms_prompt
+
 ## ================================================================
 # @ step5_translate.py & translate_lines.py
-def generate_shared_prompt(previous_content_prompt, after_content_prompt, summary_prompt, things_to_note_prompt):
-    return f'''### Context Information
+def generate_shared_prompt(previous_content_prompt, after_content_prompt, summary_prompt, things_to_note_prompt, reference_prompt=None):
+    shared_prompt = f'''### Context Information
 <previous_content>
 {previous_content_prompt}
 </previous_content>
@@ -124,6 +228,13 @@ def generate_shared_prompt(previous_content_prompt, after_content_prompt, summar
 
 ### Points to Note
 {things_to_note_prompt}'''
+    if reference_prompt:
+        shared_prompt += f'''
+
+### Reference Translations
+Earlier translations of similar sentences, keep wording consistent with them where the meaning is the same
+{reference_prompt}'''
+    return shared_prompt
 
 def get_prompt_faithfulness(lines, shared_prompt):
     TARGET_LANGUAGE = load_key("target_language")
@@ -277,6 +388,45 @@ Pre-processed {src_language} Subtitles ([br] indicates split points): {src_part}
         align_parts_json=align_parts_json,
     )
 
+def get_split_align_prompt(src_sub, tr_sub, num_parts = 2):
+    TARGET_LANGUAGE = load_key("target_language")
+    src_language = load_key("whisper.detected_language")
+    align_parts_json = ','.join(
+        f'''
+        {{
+            "target_part_{i+1}": "{TARGET_LANGUAGE} subtitle part aligned with source part {i+1}"
+        }}''' for i in range(num_parts)
+    )
+    split_align_prompt = f'''
+### Role Definition
+You are a Netflix subtitle splitting and alignment expert fluent in both {src_language} and {TARGET_LANGUAGE}.
+
+### Task Description
+1. Split the {src_language} subtitle into {num_parts} parts of roughly equal length at natural points like punctuation marks or conjunctions, marking each split position with [br]
+2. Keep the {src_language} text unchanged apart from the [br] tags
+3. Split the {TARGET_LANGUAGE} subtitle into {num_parts} parts that correspond to the {src_language} parts, analysing the word order and structural correspondence between them
+4. Never leave empty lines. If it's difficult to split based on meaning, you may appropriately rewrite the sentences that need to be aligned
+5. Do not add comments or explanations in the translation, as the subtitles are for the audience to read
+
+### Subtitle Data
+<subtitles>
+{src_language} Original: "{src_sub}"
+{TARGET_LANGUAGE} Original: "{tr_sub}"
+</subtitles>
+
+### Output in JSON
+{{
+    "analysis": "Brief analysis of the split points and the correspondence between {src_language} and {TARGET_LANGUAGE} subtitles",
+    "src_split": "Complete {src_language} subtitle with [br] tags at split positions",
+    "align": [
+        {align_parts_json}
+    ]
+}}
+
+### Your Answer, Provide ONLY a valid JSON object:
+'''
+    return split_align_prompt.strip()
+
 ## ================================================================
 # @ step8_gen_audio_task.py @ step10_gen_audio.py
 def get_subtitle_trim_prompt(text, duration):
@@ -1,4 +1,5 @@
 import os,sys
+import threading
 import spacy
 from spacy.cli import download
 from rich import print
@@ -6,6 +7,12 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 from core.config_utils import load_key
 
 SPACY_MODEL_MAP = load_key("spacy_model_map")
+# Components that are not needed when only tokens are counted
+TOKENIZER_ONLY_EXCLUDE = ("tok2vec", "transformer", "tagger", "morphologizer", "parser", "senter", "attribute_ruler", "lemmatizer", "trainable_lemmatizer", "ner")
+
+# Loaded models keyed by (model name, excluded components), shared by every job in this process
+_NLP_CACHE = {}
+_NLP_CACHE_LOCK = threading.Lock()
 
 def get_spacy_model(language: str):
     model = SPACY_MODEL_MAP.get(language.lower(), "en_core_web_md")
@@ -13,19 +20,38 @@ def get_spacy_model(language: str):
         print(f"[yellow]Spacy model does not support '{language}', using en_core_web_md model as fallback...[/yellow]")
     return model
 
-def init_nlp():
-    try:
-        language = "en" if load_key("whisper.language") == "en" else load_key("whisper.detected_language")
-        model = get_spacy_model(language)
-        print(f"[blue]⏳ Loading NLP Spacy model: <{model}> ...[/blue]")
+def load_spacy_model(model: str, exclude=()):
+    """Load a spacy model once per process and return the cached instance afterwards"""
+    key = (model, tuple(sorted(exclude)))
+    with _NLP_CACHE_LOCK:
+        if key in _NLP_CACHE:
+            return _NLP_CACHE[key]
         try:
-            nlp = spacy.load(model)
+            print(f"[blue]⏳ Loading NLP Spacy model: <{model}> ...[/blue]")
+            try:
+                nlp = spacy.load(model, exclude=list(exclude))
+            except:
+                print(f"[yellow]Downloading {model} model...[/yellow]")
+                print("[yellow]If download failed, please check your network and try again.[/yellow]")
+                download(model)
+                nlp = spacy.load(model, exclude=list(exclude))
         except:
-            print(f"[yellow]Downloading {model} model...[/yellow]")
-            print("[yellow]If download failed, please check your network and try again.[/yellow]")
-            download(model)
-            nlp = spacy.load(model)
-    except:
-        raise ValueError(f"❌ Failed to load NLP Spacy model: {model}")
-    print(f"[green]✅ NLP Spacy model loaded successfully![/green]")
-    return nlp
\ No newline at end of file
+            raise ValueError(f"❌ Failed to load NLP Spacy model: {model}")
+        print(f"[green]✅ NLP Spacy model loaded successfully![/green]")
+        _NLP_CACHE[key] = nlp
+        return nlp
+
+def clear_nlp_cache():
+    with _NLP_CACHE_LOCK:
+        _NLP_CACHE.clear()
+
+def get_nlp_language():
+    return "en" if load_key("whisper.language") == "en" else load_key("whisper.detected_language")
+
+def init_nlp():
+    """Full pipeline for the current language"""
+    return load_spacy_model(get_spacy_model(get_nlp_language()))
+
+def init_tokenizer():
+    """Tokenizer-only pipeline for the current language, for call sites that only count tokens"""
+    return load_spacy_model(get_spacy_model(get_nlp_language()), exclude=TOKENIZER_ONLY_EXCLUDE)
@@ -2,8 +2,8 @@ import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 import itertools
 import os,sys
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from load_nlp_model import init_nlp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from core.spacy_utils.load_nlp_model import init_nlp
 from rich import print
 
 def is_valid_phrase(phrase):
@@ -27,8 +27,7 @@ def analyze_comma(start, doc, token):
 
     return suitable_for_splitting
 
-def split_by_comma(text, nlp):
-    doc = nlp(text)
+def split_by_comma(doc):
     sentences = []
     start = 0
     
@@ -50,28 +49,12 @@ def split_by_comma(text, nlp):
     sentences.append(doc[start:].text.strip())
     return sentences
 
-def split_by_comma_main(nlp):
-
-    with open("output/log/sentence_by_mark.txt", "r", encoding="utf-8") as input_file:
-        sentences = input_file.readlines()
-
-    all_split_sentences = []
-    for sentence in sentences:
-        split_sentences = split_by_comma(sentence.strip(), nlp)
-        all_split_sentences.extend(split_sentences)
-
-    with open("output/log/sentence_by_comma.txt", "w", encoding="utf-8") as output_file:
-        for sentence in all_split_sentences:
-            output_file.write(sentence + "\n")
-    
-    # delete the original file
-    os.remove("output/log/sentence_by_mark.txt")
-    
-    print("[green]💾 Sentences split by commas saved to →  `sentences_by_comma.txt`[/green]")
+def split_sentences_by_comma(sentences, nlp):
+    """Yield sentences split at commas and colons"""
+    for doc in nlp.pipe(sentence.strip() for sentence in sentences):
+        yield from split_by_comma(doc)
 
 if __name__ == "__main__":
     nlp = init_nlp()
-    split_by_comma_main(nlp)
-    # nlp = init_nlp()
-    # test = "So in the same frame, right there, almost in the exact same spot on the ice, Brown has committed himself, whereas McDavid has not."
-    # print(split_by_comma(test, nlp))
\ No newline at end of file
+    test = "So in the same frame, right there, almost in the exact same spot on the ice, Brown has committed himself, whereas McDavid has not."
+    print(list(split_sentences_by_comma([test], nlp)))
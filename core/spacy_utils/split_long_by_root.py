@@ -62,43 +62,36 @@ def split_extremely_long_sentence(doc):
 
 
 
-def split_long_by_root_main(nlp):
-
-    with open("output/log/sentence_splitbyconnector.txt", "r", encoding="utf-8") as input_file:
-        sentences = input_file.readlines()
+def split_long_by_root(sentences, nlp):
+    """Yield sentences with overly long ones split by root, dropping empty or punctuation-only lines"""
+    punctuation = string.punctuation + "'" + '"'  # include all punctuation and apostrophe ' and "
 
-    all_split_sentences = []
-    for sentence in sentences:
-        doc = nlp(sentence.strip())
+    previous = None
+    for i, doc in enumerate(nlp.pipe(sentence.strip() for sentence in sentences)):
         if len(doc) > 60:
             split_sentences = split_long_sentence(doc)
             if any(len(nlp(sent)) > 60 for sent in split_sentences):
                 split_sentences = [subsent for sent in split_sentences for subsent in split_extremely_long_sentence(nlp(sent))]
-            all_split_sentences.extend(split_sentences)
-            print(f"[yellow]✂️  Splitting long sentences by root: {sentence[:30]}...[/yellow]")
+            print(f"[yellow]✂️  Splitting long sentences by root: {doc.text[:30]}...[/yellow]")
         else:
-            all_split_sentences.append(sentence.strip())
-
-    punctuation = string.punctuation + "'" + '"'  # include all punctuation and apostrophe ' and "
+            split_sentences = [doc.text]
 
-    with open("output/log/sentence_splitbynlp.txt", "w", encoding="utf-8") as output_file:
-        for i, sentence in enumerate(all_split_sentences):
+        for sentence in split_sentences:
             stripped_sentence = sentence.strip()
             if not stripped_sentence or all(char in punctuation for char in stripped_sentence):
                 print(f"[yellow]⚠️  Warning: Empty or punctuation-only line detected at index {i}[/yellow]")
-                if i > 0:
-                    all_split_sentences[i-1] += sentence
+                if previous is not None:
+                    previous += sentence
                 continue
-            output_file.write(sentence + "\n")
-
-    # delete the original file
-    os.remove("output/log/sentence_splitbyconnector.txt")   
-
-    print("[green]💾 Long sentences split by root saved to →  `sentence_splitbynlp.txt`[/green]")
+            if previous is not None:
+                yield previous
+            previous = sentence
+    if previous is not None:
+        yield previous
 
 if __name__ == "__main__":
     nlp = init_nlp()
-    split_long_by_root_main(nlp)
+    print(list(split_long_by_root(["This is a short sentence.", "..."], nlp)))
     # raw = "平口さんの盛り上げごまが初めて売れました本当に嬉しいです本当にやっぱり見た瞬間いいって言ってくれるそういうコマを作るのがやっぱりいいですよねその2ヶ月後チコさんが何やらそわそわしていましたなんか気持ち悪いやってきたのは平口さんの駒の評判を聞きつけた愛知県の収集家ですこの男性師匠大沢さんの駒も持っているといいますちょっと褒めすぎかなでも確実にファンは広がっているようです自信がない部分をすごく感じてたのでこれで自信を持って進んでくれるなっていう本当に始まったばっかりこれからいろいろ挑戦していってくれるといいなと思って今月平口さんはある場所を訪れましたこれまで数々のタイトル戦でコマを提供してきた老舗5番手平口さんのコマを扱いたいと言いますいいですねぇ困ってだんだん成長しますので大切に使ってそういう長く良い駒になる駒ですね商談が終わった後店主があるものを取り出しましたこの前の名人戦で使った駒があるんですけど去年、名人銭で使われた盛り上げごま低く盛り上げて品良くするというのは難しい素晴らしいですね平口さんが目指す高みですこういった感じで作れればまだまだですけどただ、多分、咲く。"
     # nlp = init_nlp()
     # doc = nlp(raw.strip())
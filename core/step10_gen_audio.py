@@ -3,7 +3,7 @@ import sys
 import time
 import shutil
 import subprocess
-from typing import Tuple
+from typing import Tuple, List
 
 import pandas as pd
 from pydub import AudioSegment
@@ -16,6 +16,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from core.config_utils import load_key
 from core.all_whisper_methods.whisperX_utils import get_audio_duration
 from core.all_tts_functions.tts_main import tts_main
+from core.all_tts_functions.speech_rate import record_speech_rate
 
 console = Console()
 
@@ -68,20 +69,27 @@ def adjust_audio_speed(input_file: str, output_file: str, speed_factor: float) -
                 rprint(f"[red]❌ Audio speed adjustment failed, max retries reached ({max_retries})[/red]")
                 raise e
 
-def process_row(row: pd.Series, tasks_df: pd.DataFrame) -> Tuple[int, float]:
-    """Helper function for processing single row data"""
+def process_row(row: pd.Series, tasks_df: pd.DataFrame) -> Tuple[int, float, List[Tuple[str, float]]]:
+    """Helper function for processing single row data, also returns the duration of every line generated by this call"""
     number = row['number']
     lines = eval(row['lines']) if isinstance(row['lines'], str) else row['lines']
     real_dur = 0
+    new_line_durs = []
     for line_index, line in enumerate(lines):
         temp_file = TEMP_FILE_TEMPLATE.format(f"{number}_{line_index}")
+        # audio left by an earlier attempt of this step was already recorded for the speech rate
+        is_new = not os.path.exists(temp_file)
         tts_main(line, temp_file, number, tasks_df)
-        real_dur += get_audio_duration(temp_file)
-    return number, real_dur
+        line_dur = get_audio_duration(temp_file)
+        real_dur += line_dur
+        if is_new:
+            new_line_durs.append((line, line_dur))
+    return number, real_dur, new_line_durs
 
 def generate_tts_audio(tasks_df: pd.DataFrame) -> pd.DataFrame:
     """Generate TTS audio sequentially and calculate actual duration"""
     tasks_df['real_dur'] = 0
+    line_durs = []
     rprint("[bold green]🎯 Starting TTS audio generation...[/bold green]")
     
     with Progress() as progress:
@@ -91,8 +99,9 @@ def generate_tts_audio(tasks_df: pd.DataFrame) -> pd.DataFrame:
         warmup_size = min(WARMUP_SIZE, len(tasks_df))
         for _, row in tasks_df.head(warmup_size).iterrows():
             try:
-                number, real_dur = process_row(row, tasks_df)
+                number, real_dur, row_line_durs = process_row(row, tasks_df)
                 tasks_df.loc[tasks_df['number'] == number, 'real_dur'] = real_dur
+                line_durs.extend(row_line_durs)
                 progress.advance(task)
             except Exception as e:
                 rprint(f"[red]❌ Error in warmup: {str(e)}[/red]")
@@ -111,14 +120,21 @@ def generate_tts_audio(tasks_df: pd.DataFrame) -> pd.DataFrame:
                 
                 for future in as_completed(futures):
                     try:
-                        number, real_dur = future.result()
+                        number, real_dur, row_line_durs = future.result()
                         tasks_df.loc[tasks_df['number'] == number, 'real_dur'] = real_dur
+                        line_durs.extend(row_line_durs)
                         progress.advance(task)
                     except Exception as e:
                         rprint(f"[red]❌ Error: {str(e)}[/red]")
                         raise e
 
     rprint("[bold green]✨ TTS audio generation completed![/bold green]")
+    # let the next estimates learn the speech rate of this voice
+    if line_durs:
+        try:
+            record_speech_rate(*zip(*line_durs))
+        except Exception as e:
+            rprint(f"[yellow]⚠️ Failed to update the speech rate calibration: {e}[/yellow]")
     return tasks_df
 
 def process_chunk(chunk_df: pd.DataFrame, accept: float, min_speed: float) -> tuple[float, bool]:
@@ -1,24 +1,57 @@
 import sys
 import os
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from spacy_utils.split_by_comma import split_by_comma_main
-from spacy_utils.split_by_connector import split_sentences_main
-from spacy_utils.split_by_mark import split_by_mark
-from spacy_utils.split_long_by_root import split_long_by_root_main
-from spacy_utils.load_nlp_model import init_nlp
+from core.spacy_utils.split_by_comma import split_sentences_by_comma
+from core.spacy_utils.split_by_connector import split_sentences_by_connectors
+from core.spacy_utils.split_by_mark import split_by_mark, get_input_text
+from core.spacy_utils.split_long_by_root import split_long_by_root
+from core.spacy_utils.load_nlp_model import init_nlp
+from rich import print
 
-def split_by_spacy():
-    if os.path.exists('output/log/sentence_splitbynlp.txt'):
+LOG_DIR = 'output/log'
+SENTENCE_SPLITBYNLP_FILE = 'output/log/sentence_splitbynlp.txt'
+
+# (debug dump file, pass) in pipeline order, every pass maps an iterable of sentences to a generator of sentences
+SPLIT_PASSES = [
+    ('sentence_by_comma.txt', split_sentences_by_comma),
+    ('sentence_splitbyconnector.txt', split_sentences_by_connectors),
+    ('sentence_splitbynlp.txt', split_long_by_root),
+]
+
+def dump_sentences(sentences, file_path):
+    """Pass sentences through while writing each of them to `file_path`"""
+    with open(file_path, 'w', encoding='utf-8') as f:
+        for sentence in sentences:
+            f.write(sentence + '\n')
+            yield sentence
+
+def split_text_by_spacy(input_text, nlp=None, debug_dir=None):
+    """Run all spacy split passes in memory and return the final sentences.
+    If `debug_dir` is given, the output of every intermediate pass is dumped there."""
+    nlp = nlp or init_nlp()
+    sentences = split_by_mark(input_text, nlp)
+    if debug_dir:
+        os.makedirs(debug_dir, exist_ok=True)
+        sentences = dump_sentences(sentences, os.path.join(debug_dir, 'sentence_by_mark.txt'))
+    for file_name, split_pass in SPLIT_PASSES:
+        sentences = split_pass(sentences, nlp)
+        if debug_dir and file_name != os.path.basename(SENTENCE_SPLITBYNLP_FILE):
+            sentences = dump_sentences(sentences, os.path.join(debug_dir, file_name))
+    return list(sentences)
+
+def split_by_spacy(debug=False):
+    if os.path.exists(SENTENCE_SPLITBYNLP_FILE):
         print("File 'sentence_splitbynlp.txt' already exists. Skipping split_by_spacy.")
         return
-    
+
     nlp = init_nlp()
-    split_by_mark(nlp)
-    split_by_comma_main(nlp)
-    split_sentences_main(nlp)
-    split_long_by_root_main(nlp)
+    sentences = split_text_by_spacy(get_input_text(), nlp, debug_dir=LOG_DIR if debug else None)
+    with open(SENTENCE_SPLITBYNLP_FILE, 'w', encoding='utf-8') as f:
+        for sentence in sentences:
+            f.write(sentence + '\n')
+    print("[green]💾 Sentences split by spacy saved to →  `sentence_splitbynlp.txt`[/green]")
     return
 
 if __name__ == '__main__':
-    split_by_spacy()
\ No newline at end of file
+    split_by_spacy()
@@ -1,47 +1,72 @@
 import sys,os,math
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-import concurrent.futures
 from core.ask_gpt import ask_gpt
-from core.prompts_storage import get_split_prompt
+from core.llm_scheduler import make_job, run_scheduled
+from core.token_utils import estimate_tokens
+from core.prompts_storage import get_split_prompt, get_batch_split_prompt
 from difflib import SequenceMatcher
 import math
-from core.spacy_utils.load_nlp_model import init_nlp
+from core.spacy_utils.load_nlp_model import init_tokenizer
 from core.config_utils import load_key, get_joiner
 from rich.console import Console
 from rich.table import Table
 
+try:
+    # C-accelerated matcher, falls back to difflib when not installed
+    from rapidfuzz.distance import Indel
+except ImportError:
+    Indel = None
+
 console = Console()
 
-def tokenize_sentence(sentence, nlp):
-    # tokenizer counts the number of words in the sentence
-    doc = nlp(sentence)
-    return [token.text for token in doc]
+def count_tokens(sentence, nlp, token_counts=None):
+    """Count the tokens of a sentence with the tokenizer only, memoized in `token_counts`"""
+    if token_counts is not None and sentence in token_counts:
+        return token_counts[sentence]
+    count = len(nlp.make_doc(sentence))
+    if token_counts is not None:
+        token_counts[sentence] = count
+    return count
+
+def similarity_ratio(a, b):
+    if Indel is not None:
+        return Indel.normalized_similarity(a, b)
+    return SequenceMatcher(None, a, b).ratio()
+
+def get_alignment_opcodes(a, b):
+    if Indel is not None:
+        return Indel.opcodes(a, b).as_list()
+    return SequenceMatcher(None, a, b, autojunk=False).get_opcodes()
+
+def map_to_original(opcodes, position, original_length):
+    """Map a position in the modified text to the corresponding position in the original text"""
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal' and j1 <= position <= j2:
+            return i1 + position - j1
+        if tag != 'equal' and j1 <= position < j2:
+            # inside a changed region, interpolate proportionally
+            return i1 + round((position - j1) * (i2 - i1) / (j2 - j1))
+    return original_length
 
 def find_split_positions(original, modified):
+    """Align the original text with the [br]-marked text once and map every [br] back to a cut index"""
     split_positions = []
-    parts = modified.split('[br]')
-    start = 0
     whisper_language = load_key("whisper.language")
     language = load_key("whisper.detected_language") if whisper_language == 'auto' else whisper_language
     joiner = get_joiner(language)
+    parts = [joiner.join(part.split()) for part in modified.split('[br]')]
+    opcodes = get_alignment_opcodes(original, joiner.join(parts))
+    start = 0
+    boundary = 0
 
     for i in range(len(parts) - 1):
-        max_similarity = 0
-        best_split = None
-
-        for j in range(start, len(original)):
-            original_left = original[start:j]
-            modified_left = joiner.join(parts[i].split())
-
-            left_similarity = SequenceMatcher(None, original_left, modified_left).ratio()
-
-            if left_similarity > max_similarity:
-                max_similarity = left_similarity
-                best_split = j
+        boundary += len(parts[i]) + (len(joiner) if i > 0 else 0)
+        best_split = min(max(start, map_to_original(opcodes, boundary, len(original))), len(original))
+        max_similarity = similarity_ratio(original[start:best_split], parts[i])
 
         if max_similarity < 0.9:
             console.print(f"[yellow]Warning: low similarity found at the best split point: {max_similarity}[/yellow]")
-        if best_split is not None:
+        if max_similarity > 0:
             split_positions.append(best_split)
             start = best_split
         else:
@@ -49,18 +74,15 @@ def find_split_positions(original, modified):
 
     return split_positions
 
-def split_sentence(sentence, num_parts, word_limit=18, index=-1, retry_attempt=0):
-    """Split a long sentence using GPT and return the result as a string."""
-    split_prompt = get_split_prompt(sentence, num_parts, word_limit)
-    def valid_split(response_data):
-        if 'split' not in response_data:
-            return {"status": "error", "message": "Missing required key: `split`"}
-        if "[br]" not in response_data["split"]:
-            return {"status": "error", "message": "Split failed, no [br] found"}
-        return {"status": "success", "message": "Split completed"}
-    
-    response_data = ask_gpt(split_prompt + ' ' * retry_attempt, response_json=True, valid_def=valid_split, log_title='sentence_splitbymeaning')
-    best_split = response_data["split"]
+def valid_split(response_data):
+    if not isinstance(response_data, dict) or 'split' not in response_data:
+        return {"status": "error", "message": "Missing required key: `split`"}
+    if "[br]" not in response_data["split"]:
+        return {"status": "error", "message": "Split failed, no [br] found"}
+    return {"status": "success", "message": "Split completed"}
+
+def apply_split(sentence, best_split, index=-1):
+    """Cut the original sentence where the [br]-marked answer splits it, so the text itself is never altered"""
     split_points = find_split_positions(sentence, best_split)
     # split the sentence based on the split points
     for i, split_point in enumerate(split_points):
@@ -82,30 +104,83 @@ def split_sentence(sentence, num_parts, word_limit=18, index=-1, retry_attempt=0
     
     return best_split
 
-def parallel_split_sentences(sentences, max_length, max_workers, nlp, retry_attempt=0):
-    """Split sentences in parallel using a thread pool."""
-    new_sentences = [None] * len(sentences)
-    futures = []
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        for index, sentence in enumerate(sentences):
-            # Use tokenizer to split the sentence
-            tokens = tokenize_sentence(sentence, nlp)
-            # print("Tokenization result:", tokens)
-            num_parts = math.ceil(len(tokens) / max_length)
-            if len(tokens) > max_length:
-                future = executor.submit(split_sentence, sentence, num_parts, max_length, index=index, retry_attempt=retry_attempt)
-                futures.append((future, index, num_parts, sentence))
-            else:
-                new_sentences[index] = [sentence]
-
-        for future, index, num_parts, sentence in futures:
-            split_result = future.result()
-            if split_result:
-                split_lines = split_result.strip().split('\n')
-                new_sentences[index] = [line.strip() for line in split_lines]
+def split_sentence(sentence, num_parts, word_limit=18, index=-1, retry_attempt=0):
+    """Split a long sentence using GPT and return the result as a string."""
+    split_prompt = get_split_prompt(sentence, num_parts, word_limit)
+    response_data = ask_gpt(split_prompt + ' ' * retry_attempt, response_json=True, valid_def=valid_split, log_title='sentence_splitbymeaning')
+    return apply_split(sentence, response_data["split"], index)
+
+def split_sentences_batch(items, word_limit=18, retry_attempt=0):
+    """Split several sentences with one request per round. `items` is a list of (index, sentence, num_parts).
+    Every answer is validated on its own, only the failed sentences are asked again and the last ones fall back to single requests."""
+    results = {}
+    pending = items
+    for attempt in range(3):
+        split_prompt = get_batch_split_prompt([(sentence, num_parts) for _, sentence, num_parts in pending], word_limit)
+        response_data = ask_gpt(split_prompt + ' ' * (retry_attempt + attempt), response_json=True,
+                                valid_def=lambda data: {"status": "success" if isinstance(data, dict) else "error", "message": "Expected a JSON object"},
+                                log_title='sentence_splitbymeaning_batch')
+        failed = []
+        for key, (index, sentence, num_parts) in enumerate(pending, 1):
+            item = response_data.get(str(key))
+            if valid_split(item)["status"] == "success":
+                results[index] = apply_split(sentence, item["split"], index)
             else:
-                new_sentences[index] = [sentence]
+                failed.append((index, sentence, num_parts))
+        pending = failed
+        if not pending:
+            return results
+        console.print(f"[yellow]⚠️ {len(pending)} sentence(s) of the batch were not split, asking again...[/yellow]")
+    for index, sentence, num_parts in pending:
+        results[index] = split_sentence(sentence, num_parts, word_limit, index=index, retry_attempt=retry_attempt)
+    return results
+
+def pack_split_batches(items, token_budget, word_limit):
+    """Group (index, sentence, num_parts) items so every batch prompt stays within the estimated token budget.
+    Yields every batch as soon as it is full."""
+    overhead = estimate_tokens(get_batch_split_prompt([], word_limit))
+    batch, batch_cost = [], overhead
+    for item in items:
+        # the sentence appears in the prompt and is restated with its [br] tags in the answer
+        cost = 2 * estimate_tokens(item[1]) + 20
+        if batch and batch_cost + cost > token_budget:
+            yield batch, batch_cost
+            batch, batch_cost = [], overhead
+        batch.append(item)
+        batch_cost += cost
+    if batch:
+        yield batch, batch_cost
+
+def estimate_split_cost(sentence, num_parts, max_length):
+    """Estimated prompt + completion tokens of one split request, the completion restates the sentence with its splits"""
+    return estimate_tokens(get_split_prompt(sentence, num_parts, max_length)) + 2 * estimate_tokens(sentence)
+
+def parallel_split_sentences(sentences, max_length, max_workers, nlp, retry_attempt=0, token_counts=None):
+    """Split sentences in parallel. Sentences are submitted as soon as they are counted, free workers take the longest waiting request first."""
+    new_sentences = [[sentence] for sentence in sentences]
+    def count_long_sentences():
+        for index, sentence in enumerate(sentences):
+            num_tokens = count_tokens(sentence, nlp, token_counts)
+            if num_tokens > max_length:
+                yield index, sentence, math.ceil(num_tokens / max_length)
+
+    batch_token_budget = load_key("split_batch_token_budget")
+    if batch_token_budget > 0:
+        jobs = (make_job(batch_index, split_sentences_batch, batch, max_length, retry_attempt=retry_attempt, cost=cost)
+                for batch_index, (batch, cost) in enumerate(pack_split_batches(count_long_sentences(), batch_token_budget, max_length)))
+        split_results = {}
+        for batch_results in run_scheduled(jobs, max_workers, "Split by meaning").values():
+            split_results.update(batch_results)
+    else:
+        jobs = (make_job(index, split_sentence, sentence, num_parts, max_length, index=index, retry_attempt=retry_attempt,
+                         cost=estimate_split_cost(sentence, num_parts, max_length))
+                for index, sentence, num_parts in count_long_sentences())
+        split_results = run_scheduled(jobs, max_workers, "Split by meaning")
+
+    for index, split_result in split_results.items():
+        if split_result:
+            split_lines = split_result.strip().split('\n')
+            new_sentences[index] = [line.strip() for line in split_lines]
 
     return [sentence for sublist in new_sentences for sentence in sublist]
 
@@ -115,10 +190,14 @@ def split_sentences_by_meaning():
     with open('output/log/sentence_splitbynlp.txt', 'r', encoding='utf-8') as f:
         sentences = [line.strip() for line in f.readlines()]
 
-    nlp = init_nlp()
-    # 🔄 process sentences multiple times to ensure all are split
+    nlp = init_tokenizer()
+    max_length = load_key("max_split_length")
+    token_counts = {}
+    # 🔄 process sentences multiple times to ensure all are split, token counts are shared across passes
     for retry_attempt in range(3):
-        sentences = parallel_split_sentences(sentences, max_length=load_key("max_split_length"), max_workers=load_key("max_workers"), nlp=nlp, retry_attempt=retry_attempt)
+        if retry_attempt > 0 and all(count_tokens(sentence, nlp, token_counts) <= max_length for sentence in sentences):
+            break
+        sentences = parallel_split_sentences(sentences, max_length=max_length, max_workers=load_key("max_workers"), nlp=nlp, retry_attempt=retry_attempt, token_counts=token_counts)
 
     # 💾 save results
     with open('output/log/sentence_splitbymeaning.txt', 'w', encoding='utf-8') as f:
@@ -1,8 +1,10 @@
 import os, sys, json
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import concurrent.futures
 from core.ask_gpt import ask_gpt
-from core.prompts_storage import get_summary_prompt
+from core.prompts_storage import get_summary_prompt, get_summary_reduce_prompt, get_terms_translation_prompt
 from core.config_utils import load_key
+from core.terminology_index import get_terminology_index
 import pandas as pd
 
 TERMINOLOGY_JSON_PATH = 'output/log/terminology.json'
@@ -17,24 +19,64 @@ def combine_chunks():
     combined_text = ' '.join(cleaned_sentences)
     return combined_text[:load_key('summary_length')]  #! Return only the first x characters
 
-def search_things_to_note_in_prompt(sentence):
+def search_things_to_note_in_prompt(sentence, terminology_index=None):
     """Search for terms to note in the given sentence"""
-    with open(TERMINOLOGY_JSON_PATH, 'r', encoding='utf-8') as file:
-        things_to_note = json.load(file)
-    things_to_note_list = [term['src'] for term in things_to_note['terms'] if term['src'].lower() in sentence.lower()]
-    if things_to_note_list:
-        prompt = '\n'.join(
-            f'{i+1}. "{term["src"]}": "{term["tgt"]}",'
-            f' meaning: {term["note"]}'
-            for i, term in enumerate(things_to_note['terms'])
-            if term['src'] in things_to_note_list
-        )
-        return prompt
-    else:
-        return None
+    terminology_index = terminology_index or get_terminology_index(TERMINOLOGY_JSON_PATH)
+    return terminology_index.get_prompt(sentence)
+
+def valid_summary(response_data):
+    required_keys = {'src', 'tgt', 'note'}
+    if 'terms' not in response_data:
+        return {"status": "error", "message": "Invalid response format"}
+    for term in response_data['terms']:
+        if not all(key in term for key in required_keys):
+            return {"status": "error", "message": "Invalid response format"}
+    return {"status": "success", "message": "Summary completed"}
+
+def split_summary_windows(window_size):
+    """Split the whole transcript into windows of at most window_size characters at sentence boundaries"""
+    with open(SENTENCE_TXT_PATH, 'r', encoding='utf-8') as file:
+        sentences = [line.strip() for line in file.readlines() if line.strip()]
+    windows = []
+    window = ''
+    for sentence in sentences:
+        if window and len(window) + len(sentence) + 1 > window_size:
+            windows.append(window)
+            window = ''
+        window = f'{window} {sentence}' if window else sentence
+    if window:
+        windows.append(window)
+    return windows
+
+def merge_terms(term_lists):
+    """Deduplicate terms by case-insensitive source, the first occurrence wins"""
+    merged = {}
+    for terms in term_lists:
+        for term in terms:
+            merged.setdefault(str(term['src']).strip().lower(), term)
+    return list(merged.values())
+
+def get_summary_map_reduce(custom_terms_json):
+    """Map: extract topic and terms from every window concurrently. Reduce: merge them with one call."""
+    windows = split_summary_windows(load_key('summary_length'))
+    print(f"📝 Extracting terminology from {len(windows)} windows ...")
+
+    def summarize_window(window):
+        return ask_gpt(get_summary_prompt(window, custom_terms_json), response_json=True, valid_def=valid_summary, log_title='summary')
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=load_key("max_workers")) as executor:
+        window_summaries = list(executor.map(summarize_window, windows))
+
+    if len(window_summaries) == 1:
+        return window_summaries[0]
+
+    topics = [window_summary.get('topic', '') for window_summary in window_summaries]
+    terms = merge_terms(window_summary['terms'] for window_summary in window_summaries)
+    print(f"📝 Merging {len(terms)} terms from {len(windows)} windows ...")
+    reduce_prompt = get_summary_reduce_prompt(topics, terms)
+    return ask_gpt(reduce_prompt, response_json=True, valid_def=valid_summary, log_title='summary_reduce')
 
 def get_summary():
-    src_content = combine_chunks()
     custom_terms = pd.read_excel(CUSTOM_TERMS_PATH)
     custom_terms_json = {
         "terms": [
@@ -49,19 +91,15 @@ def get_summary():
     if len(custom_terms) > 0:
         print(f"📖 Custom Terms Loaded: {len(custom_terms)} terms")
         print("📝 Terms Content:", json.dumps(custom_terms_json, indent=2, ensure_ascii=False))
-    summary_prompt = get_summary_prompt(src_content, custom_terms_json)
-    print("📝 Summarizing and extracting terminology ...")
-    
-    def valid_summary(response_data):
-        required_keys = {'src', 'tgt', 'note'}
-        if 'terms' not in response_data:
-            return {"status": "error", "message": "Invalid response format"}
-        for term in response_data['terms']:
-            if not all(key in term for key in required_keys):
-                return {"status": "error", "message": "Invalid response format"}
-        return {"status": "success", "message": "Summary completed"}
 
-    summary = ask_gpt(summary_prompt, response_json=True, valid_def=valid_summary, log_title='summary')
+    if load_key('summary_map_reduce'):
+        summary = get_summary_map_reduce(custom_terms_json)
+    else:
+        src_content = combine_chunks()
+        summary_prompt = get_summary_prompt(src_content, custom_terms_json)
+        print("📝 Summarizing and extracting terminology ...")
+        summary = ask_gpt(summary_prompt, response_json=True, valid_def=valid_summary, log_title='summary')
+
     if 'terms' in summary:
         summary['terms'].extend(custom_terms_json['terms'])
     
@@ -70,5 +108,19 @@ def get_summary():
 
     print(f'💾 Summary log saved to → `{TERMINOLOGY_JSON_PATH}`')
 
+def translate_terms():
+    """Translate the terms extracted for another target language into the current one, instead of extracting them again"""
+    with open(TERMINOLOGY_JSON_PATH, 'r', encoding='utf-8') as f:
+        summary = json.load(f)
+    if summary.get('terms'):
+        print(f"📝 Translating {len(summary['terms'])} terms into {load_key('target_language')} ...")
+        response = ask_gpt(get_terms_translation_prompt(summary.get('topic', ''), summary['terms']), response_json=True, valid_def=valid_summary, log_title='terms_translation')
+        translations = {str(term['src']): term['tgt'] for term in response['terms']}
+        for term in summary['terms']:
+            term['tgt'] = translations.get(str(term['src']), term['tgt'])
+
+    with open(TERMINOLOGY_JSON_PATH, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=4)
+
 if __name__ == '__main__':
-    get_summary()
\ No newline at end of file
+    get_summary()
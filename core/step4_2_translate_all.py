@@ -2,10 +2,17 @@ import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import pandas as pd
 import json
-import concurrent.futures
-from core.translate_once import translate_lines
+import math
+import itertools
+from core.translate_once import translate_lines, reset_reflection_stats, print_reflection_report
+from core.prompts_storage import generate_shared_prompt, get_prompt_faithfulness
+from core.token_utils import estimate_tokens
+from core.llm_scheduler import make_job, run_scheduled
+from core.translation_memory import normalize_sentence, get_terms_key, load_translation_memory
+from core.translation_journal import JOURNAL_FILE, get_chunk_key, load_journal, append_journal
 from core.step4_1_summarize import search_things_to_note_in_prompt
-from core.step8_1_gen_audio_task import check_len_then_trim
+from core.terminology_index import get_terminology_index
+from core.step8_1_gen_audio_task import trim_subtitles
 from core.step6_generate_final_timeline import align_timestamp
 from core.config_utils import load_key
 from rich.console import Console
@@ -19,56 +26,197 @@ SENTENCE_SPLIT_FILE = "output/log/sentence_splitbymeaning.txt"
 TRANSLATION_RESULTS_FILE = "output/log/translation_results.xlsx"
 TERMINOLOGY_FILE = "output/log/terminology.json"
 CLEANED_CHUNKS_FILE = "output/log/cleaned_chunks.xlsx"
+CHUNKS_FILE = "output/log/translation_chunks.json"
+MEMORY_HITS_FILE = "output/log/translation_memory_hits.json"
 
-# Function to split text into chunks
-def split_chunks_by_chars(chunk_size=400, max_i=8): 
-    """Split text into chunks based on character count, return a list of multi-line text chunks"""
-    with open(SENTENCE_SPLIT_FILE, "r", encoding="utf-8") as file:
-        sentences = file.read().strip().split('\n')
+# Each source line appears twice in the prompt (subtitles and JSON template), and is echoed next to its translation in the completion
+LINE_PROMPT_COPIES = 2
+LINE_COMPLETION_FACTOR = 2
+LINE_JSON_OVERHEAD = 12
 
-    chunks = []
-    chunk = ''
-    sentence_count = 0
-    for sentence in sentences:
-        if len(chunk) + len(sentence + '\n') > chunk_size or sentence_count == max_i:
-            chunks.append(chunk.strip())
-            chunk = sentence + '\n'
-            sentence_count = 1
-        else:
-            chunk += sentence + '\n'
-            sentence_count += 1
-    chunks.append(chunk.strip())
+def estimate_line_tokens(sentence):
+    """Estimated prompt + completion tokens that a single line adds to a translation request"""
+    tokens = estimate_tokens(sentence)
+    return tokens * (LINE_PROMPT_COPIES + LINE_COMPLETION_FACTOR) + LINE_JSON_OVERHEAD
+
+def estimate_prompt_overhead(theme_prompt=None):
+    """Estimated tokens of the shared prompt that every chunk pays regardless of its lines"""
+    shared_prompt = generate_shared_prompt(None, None, theme_prompt, None)
+    return estimate_tokens(get_prompt_faithfulness('', shared_prompt))
+
+def split_chunks_by_tokens(sentences, token_budget, max_i, theme_prompt=None):
+    """Pack lines into chunks up to the estimated token budget, balancing chunk sizes so workers finish together"""
+    costs = [estimate_line_tokens(sentence) for sentence in sentences]
+    # context lines and terms vary per chunk, reserve a share of the budget for them
+    overhead = estimate_prompt_overhead(theme_prompt) * 1.2
+    capacity = max(token_budget - overhead, max(costs))
+    num_chunks = max(math.ceil(sum(costs) / capacity), math.ceil(len(sentences) / max_i))
+
+    # raise the chunk count until the balanced packing fits, so the last chunk is not a small straggler
+    while True:
+        target = sum(costs) / num_chunks
+        chunks = []
+        chunk, chunk_cost = [], 0
+        for sentence, cost in zip(sentences, costs):
+            # close the chunk when the line would overflow it, or when most of the line falls past the balanced target
+            if chunk and (chunk_cost + cost > capacity or len(chunk) == max_i or chunk_cost + cost / 2 > target):
+                chunks.append('\n'.join(chunk))
+                chunk, chunk_cost = [], 0
+            chunk.append(sentence)
+            chunk_cost += cost
+        chunks.append('\n'.join(chunk))
+        if len(chunks) <= num_chunks:
+            return chunks
+        num_chunks += 1
+
+def plan_chunks(sentences, token_budget, max_i, theme_prompt=None):
+    """Reuse the chunk boundaries of the previous run while the line count and settings are unchanged,
+    so editing a few source lines only invalidates the chunks around them"""
+    settings = {'max_tokens': token_budget, 'max_lines': max_i}
+    if os.path.exists(CHUNKS_FILE):
+        with open(CHUNKS_FILE, 'r', encoding='utf-8') as file:
+            plan = json.load(file)
+        if plan['settings'] == settings and sum(plan['sizes']) == len(sentences):
+            bounds = [0] + list(itertools.accumulate(plan['sizes']))
+            return ['\n'.join(sentences[start:end]) for start, end in zip(bounds, bounds[1:])]
+
+    chunks = split_chunks_by_tokens(sentences, token_budget, max_i, theme_prompt)
+    with open(CHUNKS_FILE, 'w', encoding='utf-8') as file:
+        json.dump({'settings': settings, 'sizes': [len(chunk.split('\n')) for chunk in chunks]}, file)
     return chunks
 
+def dedup_sentences(sentences):
+    """Keep the first occurrence of every normalized sentence, it is translated with the context around it"""
+    unique = {}
+    for sentence in sentences:
+        unique.setdefault(normalize_sentence(sentence), sentence)
+    return list(unique.values())
+
+def report_dedup(sentences, unique_sentences, chunks, token_budget, max_i, theme_prompt=None):
+    duplicates = len(sentences) - len(unique_sentences)
+    if not duplicates:
+        return
+    full_chunks = split_chunks_by_tokens(sentences, token_budget, max_i, theme_prompt)
+    saved_tokens = sum(estimate_line_tokens(sentence) for sentence in sentences) - sum(estimate_line_tokens(sentence) for sentence in unique_sentences)
+    saved_tokens += (len(full_chunks) - len(chunks)) * estimate_prompt_overhead(theme_prompt)
+    console.print(Panel(
+        f"Repeated lines translated once: {duplicates}/{len(sentences)}\n"
+        f"Chunks: {len(chunks)} instead of {len(full_chunks)}\n"
+        f"Estimated tokens saved: {saved_tokens}",
+        title="Deduplication", border_style="cyan"))
+
 # Get context from surrounding chunks
 def get_previous_content(chunks, chunk_index):
     return None if chunk_index == 0 else chunks[chunk_index - 1].split('\n')[-3:] # Get last 3 lines
 def get_after_content(chunks, chunk_index):
     return None if chunk_index == len(chunks) - 1 else chunks[chunk_index + 1].split('\n')[:2] # Get first 2 lines
 
+def get_chunk_context(chunks, theme_prompt, i, terminology_index=None, memory=None):
+    """Everything besides the chunk's own lines that goes into its translation prompt"""
+    tm_set = load_key("translation_memory")
+    return {
+        'previous': get_previous_content(chunks, i),
+        'after': get_after_content(chunks, i),
+        'terms': search_things_to_note_in_prompt(chunks[i], terminology_index),
+        'theme': theme_prompt,
+        'target_language': load_key('target_language'),
+        'reflect_translate': load_key('reflect_translate'),
+        'adaptive_reflection': load_key('adaptive_reflection'),
+        'references': memory.get_reference_prompt(chunks[i].split('\n'), tm_set["fuzzy_threshold"]) if memory else None,
+    }
+
 # 🔍 Translate a single chunk
-def translate_chunk(chunk, chunks, theme_prompt, i):
-    things_to_note_prompt = search_things_to_note_in_prompt(chunk)
-    previous_content_prompt = get_previous_content(chunks, i)
-    after_content_prompt = get_after_content(chunks, i)
-    translation, english_result = translate_lines(chunk, previous_content_prompt, after_content_prompt, things_to_note_prompt, theme_prompt, i)
+def translate_chunk(chunk, chunks, theme_prompt, i, terminology_index=None, context=None):
+    context = context or get_chunk_context(chunks, theme_prompt, i, terminology_index)
+    translation, english_result = translate_lines(chunk, context['previous'], context['after'], context['terms'], theme_prompt, i, context['references'])
+    # commit the chunk at once, a rerun only translates chunks that are not in the journal
+    append_journal({'key': get_chunk_key(chunk, context), 'index': i, 'source': english_result, 'translation': translation, 'context': context})
     return i, english_result, translation
 
+def get_changed_inputs(entry, chunk, context):
+    """Names of the inputs that differ from the last translation of this chunk"""
+    changed = ['source'] if entry['source'] != chunk else []
+    return changed + [name for name, value in context.items() if entry['context'].get(name) != value]
+
 # Add similarity calculation function
 def similar(a, b):
     return SequenceMatcher(None, a, b).ratio()
 
+def is_complete(result, chunk):
+    """The translation has exactly one line for every source line of the chunk"""
+    return result is not None and len(result[2].split('\n')) == len(chunk.split('\n'))
+
+def find_best_match(chunk, results):
+    """Fuzzy fallback: find the complete result whose source text is most similar to the chunk"""
+    chunk_text = ''.join(chunk.split('\n')).lower()
+    matching_results = [(r, similar(''.join(r[1].split('\n')).lower(), chunk_text)) for r in results.values() if is_complete(r, chunk)]
+    return max(matching_results, key=lambda x: x[1], default=(None, 0))
+
 # 🚀 Main function to translate all chunks
 def translate_all():
-    # Check if the file exists
-    if os.path.exists(TRANSLATION_RESULTS_FILE):
+    # Without a journal there is nothing to compare the existing results against
+    if os.path.exists(TRANSLATION_RESULTS_FILE) and not os.path.exists(JOURNAL_FILE):
         console.print(Panel("🚨 File `translation_results.xlsx` already exists, skipping TRANSLATE ALL.", title="Warning", border_style="yellow"))
         return
     
-    console.print("[bold green]Start Translating All...[/bold green]")
-    chunks = split_chunks_by_chars(chunk_size=500, max_i=10)
     with open(TERMINOLOGY_FILE, 'r', encoding='utf-8') as file:
         theme_prompt = json.load(file).get('theme')
+    with open(SENTENCE_SPLIT_FILE, "r", encoding="utf-8") as file:
+        sentences = file.read().strip().split('\n')
+    # build the terminology index once, it is shared read-only by all workers
+    terminology_index = get_terminology_index(TERMINOLOGY_FILE)
+    # repeated lines are translated once and fanned out to every occurrence afterwards
+    dedup = load_key("dedup_sentences")
+    unique_sentences = dedup_sentences(sentences) if dedup else sentences
+    # sentences translated before in another video with the same terms skip the LLM,
+    # this video's own earlier translations are not in the memory, changes to them are found by the journal
+    memory = load_translation_memory()
+    known = {}
+    if memory:
+        for sentence in unique_sentences:
+            translation = memory.lookup_exact(sentence, get_terms_key(terminology_index.get_terms(sentence)))
+            if translation is not None:
+                known[normalize_sentence(sentence)] = translation
+    pending_sentences = [sentence for sentence in unique_sentences if normalize_sentence(sentence) not in known]
+
+    chunk_set = load_key("translation_chunk")
+    chunks = plan_chunks(pending_sentences, chunk_set["max_tokens"], chunk_set["max_lines"], theme_prompt) if pending_sentences else []
+    contexts = [get_chunk_context(chunks, theme_prompt, i, terminology_index, memory) for i in range(len(chunks))]
+
+    # reuse chunks committed to the journal with the same source and context
+    journal = load_journal()
+    results = {}
+    for i, chunk in enumerate(chunks):
+        entry = journal.get(get_chunk_key(chunk, contexts[i]))
+        if entry and len(entry['translation'].split('\n')) == len(chunk.split('\n')):
+            results[i] = (i, entry['source'], entry['translation'])
+
+    if os.path.exists(TRANSLATION_RESULTS_FILE):
+        # the journal only covers chunks, lines taken from the memory are compared with the last run separately
+        last_known = None
+        if os.path.exists(MEMORY_HITS_FILE):
+            with open(MEMORY_HITS_FILE, 'r', encoding='utf-8') as file:
+                last_known = json.load(file)
+        if len(results) == len(chunks) and last_known == known:
+            console.print(Panel("🚨 File `translation_results.xlsx` is up to date, skipping TRANSLATE ALL.", title="Warning", border_style="yellow"))
+            return
+        # report what changed since the last translation of each stale chunk
+        last_entries = {entry['index']: entry for entry in journal.values()}
+        for i, chunk in enumerate(chunks):
+            if i not in results:
+                changed = get_changed_inputs(last_entries[i], chunk, contexts[i]) if i in last_entries else ['new chunk']
+                console.print(f"[yellow]🔁 Chunk {i} is outdated ({', '.join(changed)}), retranslating...[/yellow]")
+        if last_known != known:
+            console.print("[yellow]🔁 Lines reused from the translation memory changed since the last run[/yellow]")
+
+    console.print("[bold green]Start Translating All...[/bold green]")
+    # batch mode translates several videos in one process
+    reset_reflection_stats()
+    report_dedup(sentences, unique_sentences, chunks, chunk_set["max_tokens"], chunk_set["max_lines"], theme_prompt)
+    if memory:
+        console.print(f"[green]📚 Translation memory: {len(known)} lines reused, {sum(bool(context['references']) for context in contexts)}/{len(chunks)} chunks with similar references[/green]")
+    if results:
+        console.print(f"[green]♻️ Reused {len(results)}/{len(chunks)} chunks from `{JOURNAL_FILE}`[/green]")
 
     # 🔄 Use concurrent execution for translation
     with Progress(
@@ -77,39 +225,57 @@ def translate_all():
         transient=True,
     ) as progress:
         task = progress.add_task("[cyan]Translating chunks...", total=len(chunks))
-        with concurrent.futures.ThreadPoolExecutor(max_workers=load_key("max_workers")) as executor:
-            futures = []
-            for i, chunk in enumerate(chunks):
-                future = executor.submit(translate_chunk, chunk, chunks, theme_prompt, i)
-                futures.append(future)
-
-            results = []
-            for future in concurrent.futures.as_completed(futures):
-                results.append(future.result())
-                progress.update(task, advance=1)
-
-    results.sort(key=lambda x: x[0])  # Sort results based on original order
-    
+        progress.update(task, advance=len(results))
+        # schedule the most expensive chunks first so they do not extend the tail
+        overhead = estimate_prompt_overhead(theme_prompt)
+        jobs = [make_job(i, translate_chunk, chunk, chunks, theme_prompt, i, terminology_index, contexts[i],
+                         cost=overhead + sum(estimate_line_tokens(line) for line in chunk.split('\n')))
+                for i, chunk in enumerate(chunks) if i not in results]
+
+        def on_done(job, result):
+            i, english_result, translation = result
+            results[i] = (i, english_result, translation)
+            progress.update(task, advance=1)
+        run_scheduled(jobs, load_key("max_workers"), "Translate all", on_done=on_done)
+
     # 💾 Save results to lists and Excel file
     src_text, trans_text = [], []
     for i, chunk in enumerate(chunks):
         chunk_lines = chunk.split('\n')
         src_text.extend(chunk_lines)
-        
-        # Calculate similarity between current chunk and translation results
-        chunk_text = ''.join(chunk_lines).lower()
-        matching_results = [(r, similar(''.join(r[1].split('\n')).lower(), chunk_text)) 
-                          for r in results]
-        best_match = max(matching_results, key=lambda x: x[1])
-        
-        # Check similarity and handle exceptions
-        if best_match[1] < 0.9:
-            console.print(f"[yellow]Warning: No matching translation found for chunk {i}[/yellow]")
-            raise ValueError(f"Translation matching failed (chunk {i})")
-        elif best_match[1] < 1.0:
-            console.print(f"[yellow]Warning: Similar match found (chunk {i}, similarity: {best_match[1]:.3f})[/yellow]")
-            
-        trans_text.extend(best_match[0][2].split('\n'))
+
+        # Results are keyed by chunk index, verify the line count of the translation before using it
+        result = results.get(i)
+        if not is_complete(result, chunk):
+            best_match = find_best_match(chunk, results)
+            # Check similarity and handle exceptions
+            if best_match[1] < 0.9:
+                console.print(f"[yellow]Warning: No matching translation found for chunk {i}[/yellow]")
+                raise ValueError(f"Translation matching failed (chunk {i})")
+            elif best_match[1] < 1.0:
+                console.print(f"[yellow]Warning: Similar match found (chunk {i}, similarity: {best_match[1]:.3f})[/yellow]")
+            result = best_match[0]
+
+        trans_text.extend(result[2].split('\n'))
+    print_reflection_report()
+    if memory:
+        memory.add([(src, trans, get_terms_key(terminology_index.get_terms(src))) for src, trans in zip(src_text, trans_text)
+                    if memory.lookup_exact(src, get_terms_key(terminology_index.get_terms(src))) != trans])
+
+    # fan translations out to every line, in sentence order the pending lines are exactly the translated ones
+    translated = iter(trans_text)
+    translations = {}
+    trans_text = []
+    for sentence in sentences:
+        key = normalize_sentence(sentence)
+        if key in known:
+            trans_text.append(known[key])
+        elif dedup and key in translations:
+            trans_text.append(translations[key])
+        else:
+            translations[key] = next(translated)
+            trans_text.append(translations[key])
+    src_text = sentences
     
     # Trim long translation text
     df_text = pd.read_excel(CLEANED_CHUNKS_FILE)
@@ -118,11 +284,14 @@ def translate_all():
     subtitle_output_configs = [('trans_subs_for_audio.srt', ['Translation'])]
     df_time = align_timestamp(df_text, df_translate, subtitle_output_configs, output_dir=None, for_display=False)
     console.print(df_time)
-    # apply check_len_then_trim to df_time['Translation'], only when duration > MIN_TRIM_DURATION.
-    df_time['Translation'] = df_time.apply(lambda x: check_len_then_trim(x['Translation'], x['duration']) if x['duration'] > load_key("min_trim_duration") else x['Translation'], axis=1)
+    # trim df_time['Translation'] concurrently, only when duration > MIN_TRIM_DURATION.
+    to_trim = df_time['duration'] > load_key("min_trim_duration")
+    df_time.loc[to_trim, 'Translation'] = trim_subtitles(df_time.loc[to_trim, 'Translation'].tolist(), df_time.loc[to_trim, 'duration'].tolist())
     console.print(df_time)
     
     df_time.to_excel(TRANSLATION_RESULTS_FILE, index=False)
+    with open(MEMORY_HITS_FILE, 'w', encoding='utf-8') as file:
+        json.dump(known, file, ensure_ascii=False)
     console.print("[bold green]✅ Translation completed and results saved.[/bold green]")
 
 if __name__ == '__main__':
@@ -1,13 +1,17 @@
 import sys, os
+import numpy as np
 import pandas as pd
 from typing import List, Tuple
-import concurrent.futures
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from core.step3_2_splitbymeaning import split_sentence
+from core.step3_2_splitbymeaning import split_sentence, apply_split
 from core.ask_gpt import ask_gpt
-from core.prompts_storage import get_align_prompt
+from core.spacy_utils.load_nlp_model import init_nlp
+from core.llm_scheduler import make_job, run_scheduled
+from core.token_utils import estimate_tokens
+from core.prompts_storage import get_align_prompt, get_split_align_prompt
 from core.config_utils import load_key, get_joiner
+from core.text_length import calc_len, calc_len_series, char_weights
 from rich.panel import Panel
 from rich.console import Console
 from rich.table import Table
@@ -19,25 +23,6 @@ INPUT_FILE = "output/log/translation_results.xlsx"
 OUTPUT_SPLIT_FILE = "output/log/translation_results_for_subtitles.xlsx"
 OUTPUT_REMERGED_FILE = "output/log/translation_results_remerged.xlsx"
 
-# ! You can modify your own weights here
-# Chinese and Japanese 2.5 characters, Korean 2 characters, Thai 1.5 characters, full-width symbols 2 characters, other English-based and half-width symbols 1 character
-def calc_len(text: str) -> float:
-    text = str(text) # force convert
-    def char_weight(char):
-        code = ord(char)
-        if 0x4E00 <= code <= 0x9FFF or 0x3040 <= code <= 0x30FF:  # Chinese and Japanese
-            return 1.75
-        elif 0xAC00 <= code <= 0xD7A3 or 0x1100 <= code <= 0x11FF:  # Korean
-            return 1.5
-        elif 0x0E00 <= code <= 0x0E7F:  # Thai
-            return 1
-        elif 0xFF01 <= code <= 0xFF5E:  # full-width symbols
-            return 1.75
-        else:  # other characters (e.g. English and half-width symbols)
-            return 1
-
-    return sum(char_weight(char) for char in text)
-
 def align_subs(src_sub: str, tr_sub: str, src_part: str) -> Tuple[List[str], List[str], str]:
     align_prompt = get_align_prompt(src_sub, tr_sub, src_part)
     
@@ -69,66 +54,183 @@ def align_subs(src_sub: str, tr_sub: str, src_part: str) -> Tuple[List[str], Lis
     
     return src_parts, tr_parts, tr_remerged
 
-def split_align_subs(src_lines: List[str], tr_lines: List[str]) -> Tuple[List[str], List[str], List[str]]:
+def needs_split(src: str, tr: str) -> bool:
     subtitle_set = load_key("subtitle")
-    MAX_SUB_LENGTH = subtitle_set["max_length"]
-    TARGET_SUB_MULTIPLIER = subtitle_set["target_multiplier"]
-    remerged_tr_lines = tr_lines.copy()
-    
-    to_split = []
-    for i, (src, tr) in enumerate(zip(src_lines, tr_lines)):
-        src, tr = str(src), str(tr)
-        if len(src) > MAX_SUB_LENGTH or calc_len(tr) * TARGET_SUB_MULTIPLIER > MAX_SUB_LENGTH:
-            to_split.append(i)
-            table = Table(title=f"📏 Line {i} needs to be split")
-            table.add_column("Type", style="cyan")
-            table.add_column("Content", style="magenta")
-            table.add_row("Source Line", src)
-            table.add_row("Target Line", tr)
-            console.print(table)
-    
-    def process(i):
-        split_src = split_sentence(src_lines[i], num_parts=2).strip()
-        src_parts, tr_parts, tr_remerged = align_subs(src_lines[i], tr_lines[i], split_src)
-        src_lines[i] = src_parts
-        tr_lines[i] = tr_parts
-        remerged_tr_lines[i] = tr_remerged
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=load_key("max_workers")) as executor:
-        executor.map(process, to_split)
-    
-    # Flatten `src_lines` and `tr_lines`
-    src_lines = [item for sublist in src_lines for item in (sublist if isinstance(sublist, list) else [sublist])]
-    tr_lines = [item for sublist in tr_lines for item in (sublist if isinstance(sublist, list) else [sublist])]
-    
-    return src_lines, tr_lines, remerged_tr_lines
+    return len(src) > subtitle_set["max_length"] or calc_len(tr) * subtitle_set["target_multiplier"] > subtitle_set["max_length"]
+
+def split_align_line(src_sub: str, tr_sub: str) -> Tuple[List[str], List[str]]:
+    """Split the source line in two and align the target line to it with a single request"""
+    def valid_split_align(response_data):
+        if "[br]" not in str(response_data.get('src_split', '')):
+            return {"status": "error", "message": "Split failed, no [br] found in `src_split`"}
+        align = response_data.get('align')
+        if not isinstance(align, list) or len(align) != 2:
+            return {"status": "error", "message": "Align does not contain 2 parts as expected!"}
+        if not all(isinstance(item, dict) and str(item.get(f'target_part_{i+1}', '')).strip() for i, item in enumerate(align)):
+            return {"status": "error", "message": "Empty target part in `align`"}
+        return {"status": "success", "message": "Split and align completed"}
+
+    parsed = ask_gpt(get_split_align_prompt(src_sub, tr_sub), response_json=True, valid_def=valid_split_align, log_title='split_align_subs')
+    src_parts = [part.strip() for part in apply_split(src_sub, parsed['src_split']).split('\n')]
+    tr_parts = [item[f'target_part_{i+1}'].strip() for i, item in enumerate(parsed['align'])]
+    if len(src_parts) != len(tr_parts):
+        raise ValueError(f"Source split into {len(src_parts)} parts but target aligned into {len(tr_parts)}")
+    return src_parts, tr_parts
+
+# Strength of a cut as evidence of a natural subtitle boundary
+PUNCT_CUT = 1.0
+CLAUSE_CUT = 0.8
+PHRASE_CUT = 0.6
+WORD_CUT = 0.4
+CHAR_CUT = 0.3
+SPLIT_PUNCTUATION = set(',;:.!?，。；：！？、')
+CLAUSE_DEPS = {'cc', 'mark', 'advcl', 'relcl', 'ccomp', 'conj', 'parataxis', 'acl'}
+
+def find_source_cut(doc) -> Tuple[int, float]:
+    """Best character offset to cut the source in two, scored by boundary strength and length balance"""
+    text = doc.text
+    total = calc_len(text)
+    best_cut, best_score = -1, 0.0
+    for token in doc[1:]:
+        prev = doc[token.i - 1]
+        if prev.text in SPLIT_PUNCTUATION:
+            strength = PUNCT_CUT
+        elif token.dep_ in CLAUSE_DEPS or any(head.left_edge.i == token.i and head.dep_ in CLAUSE_DEPS for head in token.ancestors):
+            strength = CLAUSE_CUT
+        elif token.dep_ == 'prep':
+            strength = PHRASE_CUT
+        else:
+            strength = WORD_CUT if prev.whitespace_ else CHAR_CUT
+        left = calc_len(text[:token.idx].strip())
+        balance = 1 - abs(total - 2 * left) / total
+        if balance < 0.4:
+            continue
+        score = strength * (0.5 + 0.5 * balance)
+        if score > best_score:
+            best_cut, best_score = token.idx, score
+    return best_cut, best_score
+
+def find_target_cut(tr: str, ratio: float) -> Tuple[int, float]:
+    """Best character offset to cut the target near `ratio` of its weighted length, preferring punctuation"""
+    # weighted length of the text before every cut position
+    prefix = char_weights(tr).cumsum()
+    total = prefix[-1] if len(prefix) else 0.0
+    expected = ratio * total
+    uses_spaces = ' ' in tr.strip()
+    best_cut, best_score = -1, 0.0
+    for cut in range(1, len(tr)):
+        position = prefix[cut - 1]
+        prev, char = tr[cut - 1], tr[cut]
+        if prev in SPLIT_PUNCTUATION and (char == ' ' or not uses_spaces):
+            strength = PUNCT_CUT
+        elif uses_spaces:
+            if char != ' ':
+                continue
+            strength = WORD_CUT
+        else:
+            strength = CHAR_CUT
+        score = strength * max(0.0, 1 - abs(position - expected) / (0.25 * total))
+        if score > best_score:
+            best_cut, best_score = cut, score
+    return best_cut, best_score
+
+def rule_split(doc, tr: str):
+    """Split a line in two without the LLM, returns (src_parts, tr_parts, confidence)"""
+    src = doc.text
+    src_cut, src_score = find_source_cut(doc)
+    if src_cut <= 0 or not tr.strip():
+        return None, None, 0.0
+    tr_cut, tr_score = find_target_cut(tr, calc_len(src[:src_cut].strip()) / calc_len(src))
+    if tr_cut <= 0:
+        return None, None, 0.0
+    src_parts = [src[:src_cut].strip(), src[src_cut:].strip()]
+    tr_parts = [tr[:tr_cut].strip(), tr[tr_cut:].strip()]
+    if not all(src_parts) or not all(tr_parts):
+        return None, None, 0.0
+    return src_parts, tr_parts, src_score * tr_score
+
+def split_pieces(pieces: list) -> dict:
+    """Split and align every `(position, (source, target))` piece concurrently, returns {position: [(source, target), ...]} for the pieces that were split"""
+    for (i, _), (src, tr) in pieces:
+        table = Table(title=f"📏 Line {i} needs to be split")
+        table.add_column("Type", style="cyan")
+        table.add_column("Content", style="magenta")
+        table.add_row("Source Line", src)
+        table.add_row("Target Line", tr)
+        console.print(table)
+
+    def process(src, tr):
+        try:
+            src_parts, tr_parts = split_align_line(src, tr)
+        except Exception as e:
+            console.print(f"[yellow]⚠️ Combined split and align failed ({e}), falling back to two requests[/yellow]")
+            try:
+                split_src = split_sentence(src, num_parts=2).strip()
+                src_parts, tr_parts, _ = align_subs(src, tr, split_src)
+            except Exception as e:
+                # keep the line unsplit, it stays pending for the next attempt
+                console.print(f"[yellow]⚠️ Failed to split line: {e}[/yellow]")
+                return None
+        return list(zip(src_parts, tr_parts))
+
+    # confident rule-based splits skip the LLM, ambiguous lines are left to it
+    results = {}
+    llm_pieces = pieces
+    min_confidence = load_key("subtitle.rule_split_confidence")
+    if min_confidence <= 1:
+        llm_pieces = []
+        docs = init_nlp().pipe([src for _, (src, _) in pieces])
+        for (position, (src, tr)), doc in zip(pieces, docs):
+            src_parts, tr_parts, confidence = rule_split(doc, tr)
+            if src_parts is not None and confidence >= min_confidence:
+                results[position] = list(zip(src_parts, tr_parts))
+            else:
+                llm_pieces.append((position, (src, tr)))
+        console.print(f"[cyan]📐 Rule-based split: {len(results)}/{len(pieces)} line(s), {len(llm_pieces)} sent to the LLM[/cyan]")
+
+    jobs = [make_job(position, process, src, tr, cost=estimate_tokens(get_split_align_prompt(src, tr)) + 2 * estimate_tokens(f"{src}{tr}"))
+            for position, (src, tr) in llm_pieces]
+    results.update({position: parts for position, parts in run_scheduled(jobs, load_key("max_workers"), "Split subtitles").items() if parts})
+    return results
 
 def split_for_sub_main():
     console.print("[bold green]🚀 Start splitting subtitles...[/bold green]")
     
     df = pd.read_excel(INPUT_FILE)
-    src = df['Source'].tolist()
-    trans = df['Translation'].tolist()
-    
+    # every line holds the list of subtitle pieces it was split into
+    lines = [[(str(src), str(tr))] for src, tr in zip(df['Source'], df['Translation'])]
+    # measure all lines at once, later attempts only measure the new pieces
     subtitle_set = load_key("subtitle")
-    MAX_SUB_LENGTH = subtitle_set["max_length"]
-    TARGET_SUB_MULTIPLIER = subtitle_set["target_multiplier"]
-    
+    too_long = (df['Source'].astype(str).str.len() > subtitle_set["max_length"]) | \
+               (calc_len_series(df['Translation']) * subtitle_set["target_multiplier"] > subtitle_set["max_length"])
+    pending = [(int(i), 0) for i in np.flatnonzero(too_long.to_numpy())]
+
     for attempt in range(3):  # 使用固定的3次重试
-        console.print(Panel(f"🔄 Split attempt {attempt + 1}", expand=False))
-        split_src, split_trans, remerged = split_align_subs(src.copy(), trans)
-        
-        # 检查是否所有字幕都符合长度要求
-        if all(len(src) <= MAX_SUB_LENGTH for src in split_src) and \
-           all(calc_len(tr) * TARGET_SUB_MULTIPLIER <= MAX_SUB_LENGTH for tr in split_trans):
+        if not pending:
             break
-        
-        # 更新源数据继续下一轮分割
-        src = split_src
-        trans = split_trans
+        console.print(Panel(f"🔄 Split attempt {attempt + 1}, {len(pending)} line(s) too long", expand=False))
+        results = split_pieces([(position, lines[position[0]][position[1]]) for position in pending])
+
+        # only lines with split pieces are rebuilt, and only the new pieces are checked again
+        next_pending = []
+        for i in sorted({i for i, _ in results}):
+            new_pieces = []
+            for j, piece in enumerate(lines[i]):
+                for part in results.get((i, j), [piece]):
+                    if (i, j) in results and needs_split(*part):
+                        next_pending.append((i, len(new_pieces)))
+                    new_pieces.append(part)
+            lines[i] = new_pieces
+        # pieces that could not be split keep their place in the queue, their positions shift with the rebuilt line
+        failed = [position for position in pending if position not in results]
+        for i, j in failed:
+            offset = sum(len(results[(i, k)]) - 1 for k in range(j) if (i, k) in results)
+            next_pending.append((i, j + offset))
+        pending = next_pending
 
+    split_src = [src for pieces in lines for src, _ in pieces]
+    split_trans = [tr for pieces in lines for _, tr in pieces]
     pd.DataFrame({'Source': split_src, 'Translation': split_trans}).to_excel(OUTPUT_SPLIT_FILE, index=False)
-    # pd.DataFrame({'Source': src, 'Translation': remerged}).to_excel(OUTPUT_REMERGED_FILE, index=False)
 
 if __name__ == '__main__':
     split_for_sub_main()
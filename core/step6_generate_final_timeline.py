@@ -1,8 +1,11 @@
 import pandas as pd
+import numpy as np
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import re
 import time
+from bisect import bisect_right
+from difflib import SequenceMatcher
 import easy_util as eu
 from core.config_utils import load_key, get_joiner
 from rich.panel import Panel
@@ -67,72 +70,73 @@ def show_difference(str1, str2):
     print("Position markers: " + "".join("^" if i in diff_positions else " " for i in range(max(len(str1), len(str2)))))
     print(f"Difference indices: {diff_positions}")
 
-def get_sentence_timestamps(df_words, df_sentences):
-    time_stamp_list = []
-
-    # Build complete string and position mapping
-    full_words_str = ''
-    position_to_word_idx = {}
-
-    for idx, word in enumerate(df_words['text']):
-        clean_word = remove_punctuation(word.lower())
-        start_pos = len(full_words_str)
-        full_words_str += clean_word
-        for pos in range(start_pos, len(full_words_str)):
-            position_to_word_idx[pos] = idx
+def find_fuzzy_match(full_words_str, clean_sentence, current_pos, min_ratio=0.9):
+    """Resynchronize on the best approximate occurrence of the sentence near `current_pos`"""
+    sentence_len = len(clean_sentence)
+    window = full_words_str[current_pos:current_pos + 2 * sentence_len + 20]
+    blocks = [block for block in SequenceMatcher(None, window, clean_sentence, autojunk=False).get_matching_blocks() if block.size > 0]
+    if not blocks:
+        return None
+    match_start, match_end = blocks[0].a, blocks[-1].a + blocks[-1].size
+    if SequenceMatcher(None, window[match_start:match_end], clean_sentence).ratio() < min_ratio:
+        return None
+    return current_pos + match_start, current_pos + match_end
 
+def get_sentence_timestamps(df_words, df_sentences):
+    """Return (start, end) arrays with one entry per sentence in df_sentences"""
+    # Build complete string and the start offset of every word in it
+    clean_words = [remove_punctuation(word.lower()) for word in df_words['text']]
+    word_starts = np.concatenate(([0], np.cumsum([len(word) for word in clean_words])[:-1])).tolist()
+    full_words_str = ''.join(clean_words)
+    word_start_times = df_words['start'].to_numpy(dtype=float)
+    word_end_times = df_words['end'].to_numpy(dtype=float)
+
+    def word_idx_at(pos):
+        return bisect_right(word_starts, pos) - 1
+
+    starts = np.empty(len(df_sentences), dtype=float)
+    ends = np.empty(len(df_sentences), dtype=float)
     current_pos = 0
-    for idx, sentence in df_sentences['Source'].items():
+    for i, (idx, sentence) in enumerate(df_sentences['Source'].items()):
         clean_sentence = remove_punctuation(sentence.lower()).replace(" ", "")
         sentence_len = len(clean_sentence)
 
-        match_found = False
-        while current_pos <= len(full_words_str) - sentence_len:
-            if full_words_str[current_pos:current_pos+sentence_len] == clean_sentence:
-                start_word_idx = position_to_word_idx[current_pos]
-                end_word_idx = position_to_word_idx[current_pos + sentence_len - 1]
-
-                time_stamp_list.append((
-                    float(df_words['start'][start_word_idx]),
-                    float(df_words['end'][end_word_idx])
-                ))
-
-                current_pos += sentence_len
-                match_found = True
-                break
-            current_pos += 1
-
-        if not match_found:
-            print(f"\n⚠️ 警告：未找到与句子完全匹配的结果: {sentence}")
-            show_difference(clean_sentence,
-                          full_words_str[current_pos:current_pos+len(clean_sentence)])
-            print("\n原句:", df_sentences['Source'][idx])
-            raise ValueError("❎ 未找到与句子匹配的内容。")
-    
-    return time_stamp_list
+        match_pos = full_words_str.find(clean_sentence, current_pos)
+        if match_pos != -1:
+            match_start, match_end = match_pos, match_pos + sentence_len
+        else:
+            fuzzy_match = find_fuzzy_match(full_words_str, clean_sentence, current_pos)
+            if fuzzy_match is None:
+                print(f"\n⚠️ 警告：未找到与句子完全匹配的结果: {sentence}")
+                show_difference(clean_sentence,
+                              full_words_str[current_pos:current_pos+len(clean_sentence)])
+                print("\n原句:", df_sentences['Source'][idx])
+                raise ValueError("❎ 未找到与句子匹配的内容。")
+            match_start, match_end = fuzzy_match
+            print(f"\n⚠️ 警告：句子通过模糊匹配重新同步: {sentence}")
+
+        starts[i] = word_start_times[word_idx_at(match_start)]
+        ends[i] = word_end_times[word_idx_at(match_end - 1)]
+        current_pos = match_end
+
+    return starts, ends
 
 def align_timestamp(df_text, df_translate, subtitle_output_configs: list, output_dir: str, for_display: bool = True):
     """Align timestamps and add a new timestamp column to df_translate"""
     df_trans_time = df_translate.copy()
 
-    # Assign an ID to each word in df_text['text'] and create a new DataFrame
-    words = df_text['text'].str.split(expand=True).stack().reset_index(level=1, drop=True).reset_index()
-    words.columns = ['id', 'word']
-    words['id'] = words['id'].astype(int)
-
     # Process timestamps ⏰
-    time_stamp_list = get_sentence_timestamps(df_text, df_translate)
-    df_trans_time['timestamp'] = time_stamp_list
-    df_trans_time['duration'] = df_trans_time['timestamp'].apply(lambda x: x[1] - x[0])
+    starts, ends = get_sentence_timestamps(df_text, df_translate)
+    durations = ends - starts
 
     # Remove gaps 🕳️
-    for i in range(len(df_trans_time)-1):
-        delta_time = df_trans_time.loc[i+1, 'timestamp'][0] - df_trans_time.loc[i, 'timestamp'][1]
-        if 0 < delta_time < 1:
-            df_trans_time.at[i, 'timestamp'] = (df_trans_time.loc[i, 'timestamp'][0], df_trans_time.loc[i+1, 'timestamp'][0])
+    delta_time = starts[1:] - ends[:-1]
+    close_gaps = (delta_time > 0) & (delta_time < 1)
+    ends[:-1][close_gaps] = starts[1:][close_gaps]
 
     # Convert start and end timestamps to SRT format
-    df_trans_time['timestamp'] = df_trans_time['timestamp'].apply(lambda x: convert_to_srt_format(x[0], x[1]))
+    df_trans_time['timestamp'] = [convert_to_srt_format(start, end) for start, end in zip(starts, ends)]
+    df_trans_time['duration'] = durations
 
     # Polish subtitles: replace punctuation in Translation if for_display
     if for_display:
@@ -158,13 +162,16 @@ def clean_translation(x):
     cleaned = str(x).strip('。').strip('，')
     return autocorrect.format(cleaned)
 
-def align_timestamp_main():
+def generate_subtitles():
     df_text = pd.read_excel(CLEANED_CHUNKS_FILE)
     df_text['text'] = df_text['text'].str.strip('"').str.strip()
     df_translate = pd.read_excel(TRANSLATION_RESULTS_FOR_SUBTITLES_FILE)
     df_translate['Translation'] = df_translate['Translation'].apply(clean_translation)
 
     align_timestamp(df_text, df_translate, SUBTITLE_OUTPUT_CONFIGS, OUTPUT_DIR)
+
+def align_timestamp_main():
+    generate_subtitles()
     console.print(Panel("[bold green]🎉📝 Subtitles generation completed! Please check in the `output` folder 👀[/bold green]"))
 
     # for audio
@@ -9,7 +9,9 @@ from rich import print as rprint
 from rich.panel import Panel
 from rich.console import Console
 from core.config_utils import load_key  
-from core.all_tts_functions.estimate_duration import init_estimator, estimate_duration
+from core.all_tts_functions.speech_rate import init_calibrated_estimator
+from core.llm_scheduler import make_job, run_scheduled
+from core.token_utils import estimate_tokens
 
 console = Console()
 speed_factor = load_key("speed_factor")
@@ -19,33 +21,38 @@ SRC_SUBS_FOR_AUDIO_FILE = 'output/audio/src_subs_for_audio.srt'
 SOVITS_TASKS_FILE = 'output/audio/tts_tasks.xlsx'
 ESTIMATOR = None
 
-def check_len_then_trim(text, duration):
+def get_estimator():
     global ESTIMATOR
     if ESTIMATOR is None:
-        ESTIMATOR = init_estimator()
-    estimated_duration = estimate_duration(text, ESTIMATOR) / speed_factor['max']
-    
-    console.print(f"Subtitle text: {text}, "
-                  f"[bold green]Estimated reading duration: {estimated_duration:.2f} seconds[/bold green]")
+        ESTIMATOR = init_calibrated_estimator()
+    return ESTIMATOR
 
-    if estimated_duration > duration:
-        rprint(Panel(f"Estimated reading duration {estimated_duration:.2f} seconds exceeds given duration {duration:.2f} seconds, shortening...", title="Processing", border_style="yellow"))
-        original_text = text
-        prompt = get_subtitle_trim_prompt(text, duration)
-        def valid_trim(response):
-            if 'result' not in response:
-                return {'status': 'error', 'message': 'No result in response'}
-            return {'status': 'success', 'message': ''}
-        try:    
-            response = ask_gpt(prompt, response_json=True, log_title='subtitle_trim', valid_def=valid_trim)
-            shortened_text = response['result']
-        except Exception:
-            rprint("[bold red]🚫 AI refused to answer due to sensitivity, so manually remove punctuation[/bold red]")
-            shortened_text = re.sub(r'[,.!?;:，。！？；：]', ' ', text).strip()
-        rprint(Panel(f"Subtitle before shortening: {original_text}\nSubtitle after shortening: {shortened_text}", title="Subtitle Shortening Result", border_style="green"))
-        return shortened_text
-    else:
-        return text
+def trim_subtitle(text, duration, estimated_duration):
+    """Ask the LLM to shorten a subtitle that takes longer to read than its duration"""
+    rprint(Panel(f"Estimated reading duration {estimated_duration:.2f} seconds exceeds given duration {duration:.2f} seconds, shortening...", title="Processing", border_style="yellow"))
+    original_text = text
+    prompt = get_subtitle_trim_prompt(text, duration)
+    def valid_trim(response):
+        if 'result' not in response:
+            return {'status': 'error', 'message': 'No result in response'}
+        return {'status': 'success', 'message': ''}
+    try:    
+        response = ask_gpt(prompt, response_json=True, log_title='subtitle_trim', valid_def=valid_trim)
+        shortened_text = response['result']
+    except Exception:
+        rprint("[bold red]🚫 AI refused to answer due to sensitivity, so manually remove punctuation[/bold red]")
+        shortened_text = re.sub(r'[,.!?;:，。！？；：]', ' ', text).strip()
+    rprint(Panel(f"Subtitle before shortening: {original_text}\nSubtitle after shortening: {shortened_text}", title="Subtitle Shortening Result", border_style="green"))
+    return shortened_text
+
+def trim_subtitles(texts, durations):
+    """Estimate all reading durations first, then trim every over-length subtitle concurrently. Returns the texts in order."""
+    estimated_durations = get_estimator().estimate_many(texts) / speed_factor['max']
+    jobs = [make_job(i, trim_subtitle, text, duration, estimated, cost=estimate_tokens(get_subtitle_trim_prompt(text, duration)) + 2 * estimate_tokens(text))
+            for i, (text, duration, estimated) in enumerate(zip(texts, durations, estimated_durations)) if estimated > duration]
+    console.print(f"[cyan]✂️ {len(jobs)}/{len(texts)} subtitle(s) exceed their duration and will be shortened[/cyan]")
+    trimmed = run_scheduled(jobs, load_key("max_workers"), "Subtitle trim")
+    return [trimmed.get(i, text) for i, text in enumerate(texts)]
 
 def time_diff_seconds(t1, t2, base_date):
     """Calculate the difference in seconds between two time objects"""
@@ -132,7 +139,7 @@ def process_srt():
 
     ##! No longer perform secondary trim
     # check and trim subtitle length, for twice to ensure the subtitle length is within the limit, 允许tolerance
-    # df['text'] = df.apply(lambda x: check_len_then_trim(x['text'], x['duration']+x['tolerance']), axis=1)
+    # df['text'] = trim_subtitles(df['text'].tolist(), (df['duration'] + df['tolerance']).tolist())
 
     return df
 
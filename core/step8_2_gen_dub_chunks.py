@@ -1,24 +1,24 @@
 import pandas as pd
+import numpy as np
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from core.config_utils import load_key
 from core.all_whisper_methods.whisperX_utils import get_audio_duration
-from core.step8_1_gen_audio_task import time_diff_seconds
-import datetime
 import re
-from core.all_tts_functions.estimate_duration import init_estimator, estimate_duration
+from core.all_tts_functions.speech_rate import init_calibrated_estimator
 from rich import print as rprint
 
 INPUT_EXCEL = "output/audio/tts_tasks.xlsx"
 OUTPUT_EXCEL = "output/audio/tts_tasks.xlsx"
 SRC_SRT = "output/src.srt"
 TRANS_SRT = "output/trans.srt"
-MAX_MERGE_COUNT = 5
+MAX_MERGE_LINES = 3 # A fast line is merged with at most two following lines
 AUDIO_FILE = 'output/audio/raw.mp3'
 ESTIMATOR = None
 
-def calc_if_too_fast(est_dur, tol_dur, duration, tolerance):
-    accept = load_key("speed_factor.accept") # Maximum acceptable speed factor
+def calc_if_too_fast(est_dur, tol_dur, duration, tolerance, accept=None):
+    if accept is None:
+        accept = load_key("speed_factor.accept") # Maximum acceptable speed factor
     if est_dur / accept > tol_dur:  # Even max speed factor cannot adapt
         return 2
     elif est_dur > tol_dur:  # Speed adjustment needed within acceptable range
@@ -28,110 +28,94 @@ def calc_if_too_fast(est_dur, tol_dur, duration, tolerance):
     else:  # Normal speaking speed
         return 0
 
-def merge_rows(df, start_idx, merge_count):
-    """Merge multiple rows and calculate cumulative values"""
-    merged = {
-        'est_dur': df.iloc[start_idx]['est_dur'],
-        'tol_dur': df.iloc[start_idx]['tol_dur'],
-        'duration': df.iloc[start_idx]['duration']
-    }
-    
-    while merge_count < MAX_MERGE_COUNT and (start_idx + merge_count) < len(df):
-        next_row = df.iloc[start_idx + merge_count]
-        merged['est_dur'] += next_row['est_dur']
-        merged['tol_dur'] += next_row['tol_dur']
-        merged['duration'] += next_row['duration']
-        
-        speed_flag = calc_if_too_fast(
-            merged['est_dur'],
-            merged['tol_dur'],
-            merged['duration'],
-            df.iloc[start_idx + merge_count]['tolerance']
-        )
-        
-        if speed_flag <= 0 or merge_count == 2:
-            df.at[start_idx + merge_count, 'cut_off'] = 1
-            return merge_count + 1
-        
-        merge_count += 1
-    
-    # If no suitable merge point is found
-    if merge_count >= MAX_MERGE_COUNT or (start_idx + merge_count) >= len(df):
-        df.at[start_idx + merge_count - 1, 'cut_off'] = 1
-    return merge_count
+def calc_speed_flags(est_dur, tol_dur, duration, tolerance, accept):
+    """`calc_if_too_fast` over whole columns"""
+    return np.select([est_dur / accept > tol_dur, est_dur > tol_dur, est_dur < duration - tolerance], [2, 1, -1], 0)
+
+def parse_srt_times(times):
+    """'HH:MM:SS.fff' strings to integer microseconds, exact like datetime.strptime with %f"""
+    parts = pd.Series(times).astype(str).str.strip().str.extract(r'^(\d+):(\d+):(\d+)(?:\.(\d{1,6}))?$')
+    if parts[0].isna().any():
+        raise ValueError(f"Invalid time format: {pd.Series(times)[parts[0].isna()].iloc[0]}")
+    micro = parts[3].fillna('0').str.ljust(6, '0').astype(np.int64)
+    return ((parts[0].astype(np.int64) * 60 + parts[1].astype(np.int64)) * 60 + parts[2].astype(np.int64)).to_numpy() * 1000000 + micro.to_numpy()
+
+def calc_gaps(start_times, end_times, whole_dur):
+    """Silence after every subtitle until the next one starts, the last one runs until the end of the audio"""
+    starts, ends = parse_srt_times(start_times), parse_srt_times(end_times)
+    gaps = np.empty(len(ends), dtype=np.float64)
+    # next start minus this end in whole microseconds, the same value timedelta.total_seconds() gave per line
+    gaps[:-1] = (starts[1:] - ends[:-1]) / 1000000
+    # whole seconds (hour * 3600 + minute * 60 + second) plus the fraction, summed in the order of the per-line code
+    seconds, microseconds = divmod(int(ends[-1]), 1000000)
+    gaps[-1] = whole_dur - (seconds + microseconds / 1000000)
+    return gaps
 
 def analyze_subtitle_timing_and_speed(df):
     rprint("[🔍 Analyzing] Calculating subtitle timing and speed...")
     global ESTIMATOR
     if ESTIMATOR is None:
-        ESTIMATOR = init_estimator()
+        ESTIMATOR = init_calibrated_estimator()
     TOLERANCE = load_key("tolerance")
     whole_dur = get_audio_duration(AUDIO_FILE)
-    df['gap'] = 0.0  # Initialize gap column
-    for i in range(len(df) - 1):
-        current_end = datetime.datetime.strptime(df.loc[i, 'end_time'], '%H:%M:%S.%f').time()
-        next_start = datetime.datetime.strptime(df.loc[i + 1, 'start_time'], '%H:%M:%S.%f').time()
-        df.loc[i, 'gap'] = time_diff_seconds(current_end, next_start, datetime.date.today())
-    
-    # Set the gap for the last line
-    last_end = datetime.datetime.strptime(df.iloc[-1]['end_time'], '%H:%M:%S.%f').time()
-    last_end_seconds = (last_end.hour * 3600 + last_end.minute * 60 + 
-                       last_end.second + last_end.microsecond / 1000000)
-    df.iloc[-1, df.columns.get_loc('gap')] = whole_dur - last_end_seconds
-    
-    df['tolerance'] = df['gap'].apply(lambda x: TOLERANCE if x > TOLERANCE else x)
+    df['gap'] = calc_gaps(df['start_time'], df['end_time'], whole_dur)
+    df['tolerance'] = np.where(df['gap'] > TOLERANCE, TOLERANCE, df['gap'])
     df['tol_dur'] = df['duration'] + df['tolerance']
-    df['est_dur'] = df.apply(lambda x: estimate_duration(x['text'], ESTIMATOR), axis=1)
+    df['est_dur'] = ESTIMATOR.estimate_many(df['text'])
 
     ## Calculate speed indicators
     accept = load_key("speed_factor.accept") # Maximum acceptable speed factor
-    def calc_if_too_fast(row):
-        est_dur = row['est_dur']
-        tol_dur = row['tol_dur']
-        duration = row['duration']
-        tolerance = row['tolerance']
-        
-        if est_dur / accept > tol_dur:  # Even max speed factor cannot adapt
-            return 2
-        elif est_dur > tol_dur:  # Speed adjustment needed within acceptable range
-            return 1
-        elif est_dur < duration - tolerance:  # Speaking speed too slow
-            return -1
-        else:  # Normal speaking speed
-            return 0
-    
-    df['if_too_fast'] = df.apply(calc_if_too_fast, axis=1)
+    df['if_too_fast'] = calc_speed_flags(df['est_dur'].to_numpy(), df['tol_dur'].to_numpy(), df['duration'].to_numpy(), df['tolerance'].to_numpy(), accept)
     return df
 
-def process_cutoffs(df):
-    rprint("[✂️ Processing] Generating cutoff points...")
-    df['cut_off'] = 0  # Initialize cut_off column
-    df.loc[df['gap'] >= load_key("tolerance"), 'cut_off'] = 1  # Set to 1 when gap is greater than TOLERANCE
+def find_cutoffs(gap, if_too_fast, est_dur, tol_dur, duration, tolerance, tolerance_limit, accept):
+    """One pass over the lines. Returns the cut_off flags and the lines too fast even at the maximum speed factor."""
+    n = len(gap)
+    cut_off = [1 if g >= tolerance_limit else 0 for g in gap]
+    too_fast = []
     idx = 0
-    while idx < len(df):
+    while idx < n:
         # Process marked split points
-        if df.iloc[idx]['cut_off'] == 1:
-            if df.iloc[idx]['if_too_fast'] == 2:
-                rprint(f"[⚠️ Warning] Line {idx} is too fast and cannot be fixed by speed adjustment")
+        if cut_off[idx] == 1:
+            if if_too_fast[idx] == 2:
+                too_fast.append(idx)
             idx += 1
             continue
 
         # Process the last line
-        if idx + 1 >= len(df):
-            df.at[idx, 'cut_off'] = 1
+        if idx + 1 >= n:
+            cut_off[idx] = 1
             break
 
         # Process normal or slow lines
-        if df.iloc[idx]['if_too_fast'] <= 0:
-            if df.iloc[idx + 1]['if_too_fast'] <= 0:
-                df.at[idx, 'cut_off'] = 1
-                idx += 1
-            else:
-                idx += merge_rows(df, idx, 1)
-        # Process fast lines
-        else:
-            idx += merge_rows(df, idx, 1)
-    
+        if if_too_fast[idx] <= 0 and if_too_fast[idx + 1] <= 0:
+            cut_off[idx] = 1
+            idx += 1
+            continue
+
+        # Merge with the following lines until the chunk can be spoken in time
+        merged_est, merged_tol, merged_dur = est_dur[idx], tol_dur[idx], duration[idx]
+        end = idx + 1
+        while True:
+            merged_est += est_dur[end]
+            merged_tol += tol_dur[end]
+            merged_dur += duration[end]
+            if (calc_if_too_fast(merged_est, merged_tol, merged_dur, tolerance[end], accept) <= 0
+                    or end - idx + 1 == MAX_MERGE_LINES or end + 1 >= n):
+                cut_off[end] = 1
+                break
+            end += 1
+        idx = end + 1
+    return cut_off, too_fast
+
+def process_cutoffs(df):
+    rprint("[✂️ Processing] Generating cutoff points...")
+    cut_off, too_fast = find_cutoffs(
+        df['gap'].tolist(), df['if_too_fast'].tolist(), df['est_dur'].tolist(), df['tol_dur'].tolist(),
+        df['duration'].tolist(), df['tolerance'].tolist(), load_key("tolerance"), load_key("speed_factor.accept"))
+    for idx in too_fast:
+        rprint(f"[⚠️ Warning] Line {idx} is too fast and cannot be fixed by speed adjustment")
+    df['cut_off'] = cut_off
     return df
 
 def gen_dub_chunks():
@@ -207,5 +191,82 @@ def gen_dub_chunks():
     df.to_excel(OUTPUT_EXCEL, index=False)
     rprint("[✅ Complete] Matching completed successfully!")
 
+def benchmark(n_lines=10000):
+    """Row-wise timing analysis and chunking as they were before the NumPy version, on a synthetic script"""
+    import time, datetime, random
+    random.seed(0)
+    accept, tolerance_limit = load_key("speed_factor.accept"), load_key("tolerance")
+    rows, cur = [], 0.0
+    for _ in range(n_lines):
+        start = cur + random.choice([0, 0, 0.2, 0.8, 1.5, 3])
+        cur = start + random.uniform(0.5, 6)
+        rows.append((start, cur))
+    fmt = lambda t: (lambda ms: f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}")(round(t * 1000))
+    df = pd.DataFrame({'start_time': [fmt(s) for s, _ in rows], 'end_time': [fmt(e) for _, e in rows]})
+    df['duration'] = [round(e - s, 3) for s, e in rows]
+    whole_dur = cur + 2
+
+    start = time.time()
+    gaps = []
+    for i in range(len(df) - 1):
+        current_end = datetime.datetime.strptime(df.loc[i, 'end_time'], '%H:%M:%S.%f')
+        next_start = datetime.datetime.strptime(df.loc[i + 1, 'start_time'], '%H:%M:%S.%f')
+        gaps.append((next_start - current_end).total_seconds())
+    last_end = datetime.datetime.strptime(df.iloc[-1]['end_time'], '%H:%M:%S.%f').time()
+    gaps.append(whole_dur - (last_end.hour * 3600 + last_end.minute * 60 + last_end.second + last_end.microsecond / 1000000))
+    rowwise_gap_time = time.time() - start
+    start = time.time()
+    df['gap'] = calc_gaps(df['start_time'], df['end_time'], whole_dur)
+    gap_time = time.time() - start
+    assert df['gap'].tolist() == gaps
+
+    df['tolerance'] = np.where(df['gap'] > tolerance_limit, tolerance_limit, df['gap'])
+    df['tol_dur'] = df['duration'] + df['tolerance']
+    df['est_dur'] = df['duration'] * np.random.RandomState(0).uniform(0.5, 2.5, len(df))
+    df['if_too_fast'] = calc_speed_flags(df['est_dur'], df['tol_dur'], df['duration'], df['tolerance'], accept)
+
+    def rowwise_cutoffs(df):
+        def merge_rows(start_idx, merge_count):
+            merged = {key: df.iloc[start_idx][key] for key in ['est_dur', 'tol_dur', 'duration']}
+            while merge_count < 5 and (start_idx + merge_count) < len(df):
+                next_row = df.iloc[start_idx + merge_count]
+                for key in merged:
+                    merged[key] += next_row[key]
+                if calc_if_too_fast(merged['est_dur'], merged['tol_dur'], merged['duration'], next_row['tolerance'], accept) <= 0 or merge_count == 2:
+                    df.at[start_idx + merge_count, 'cut_off'] = 1
+                    return merge_count + 1
+                merge_count += 1
+            df.at[start_idx + merge_count - 1, 'cut_off'] = 1
+            return merge_count
+        df['cut_off'] = 0
+        df.loc[df['gap'] >= tolerance_limit, 'cut_off'] = 1
+        idx = 0
+        while idx < len(df):
+            if df.iloc[idx]['cut_off'] == 1:
+                idx += 1
+                continue
+            if idx + 1 >= len(df):
+                df.at[idx, 'cut_off'] = 1
+                break
+            if df.iloc[idx]['if_too_fast'] <= 0 and df.iloc[idx + 1]['if_too_fast'] <= 0:
+                df.at[idx, 'cut_off'] = 1
+                idx += 1
+            else:
+                idx += merge_rows(idx, 1)
+        return df['cut_off'].tolist()
+
+    start = time.time()
+    expected = rowwise_cutoffs(df.copy())
+    rowwise_cut_time = time.time() - start
+    start = time.time()
+    cut_off, _ = find_cutoffs(df['gap'].tolist(), df['if_too_fast'].tolist(), df['est_dur'].tolist(), df['tol_dur'].tolist(),
+                              df['duration'].tolist(), df['tolerance'].tolist(), tolerance_limit, accept)
+    cut_time = time.time() - start
+    assert cut_off == expected
+    print(f"{n_lines} lines: gaps {rowwise_gap_time:.3f}s -> {gap_time:.3f}s, cutoffs {rowwise_cut_time:.3f}s -> {cut_time:.3f}s, {sum(cut_off)} chunks, identical")
+
 if __name__ == "__main__":
-    gen_dub_chunks()
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        benchmark()
+    else:
+        gen_dub_chunks()
\ No newline at end of file
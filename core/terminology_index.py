@@ -0,0 +1,103 @@
+import os, sys, json
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from collections import deque
+from threading import Lock
+from core.config_utils import load_key
+
+INDEX_CACHE = {}
+INDEX_LOCK = Lock()
+
+class TerminologyIndex:
+    """Aho-Corasick automaton over the lowercased `src` of every term.
+    Built once, then only read, so it can be shared by all translation workers."""
+
+    def __init__(self, terms, word_boundary=False):
+        self.terms = terms
+        self.word_boundary = word_boundary
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]  # (term index, pattern length) ending at each node
+
+        for idx, term in enumerate(terms):
+            pattern = str(term['src']).lower()
+            if not pattern:
+                continue
+            node = 0
+            for char in pattern:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.output[node].append((idx, len(pattern)))
+
+        # BFS to set failure links, outputs of the failure node are inherited
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def _on_word_boundary(self, text, start, end):
+        if start > 0 and text[start - 1].isalnum() and text[start].isalnum():
+            return False
+        if end < len(text) and text[end].isalnum() and text[end - 1].isalnum():
+            return False
+        return True
+
+    def search(self, text):
+        """Return the indices of all terms found in text, in terminology order"""
+        text = text.lower()
+        found = set()
+        node = 0
+        for pos, char in enumerate(text):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            for idx, length in self.output[node]:
+                if idx in found:
+                    continue
+                if self.word_boundary and not self._on_word_boundary(text, pos - length + 1, pos + 1):
+                    continue
+                found.add(idx)
+        return sorted(found)
+
+    def get_terms(self, text):
+        return [self.terms[idx] for idx in self.search(text)]
+
+    def get_prompt(self, text):
+        matched = self.search(text)
+        if not matched:
+            return None
+        return '\n'.join(
+            f'{idx+1}. "{self.terms[idx]["src"]}": "{self.terms[idx]["tgt"]}",'
+            f' meaning: {self.terms[idx]["note"]}'
+            for idx in matched
+        )
+
+def get_terminology_index(terminology_path):
+    """Build the index once per terminology file version and share it afterwards"""
+    mtime = os.path.getmtime(terminology_path)
+    with INDEX_LOCK:
+        cached = INDEX_CACHE.get(terminology_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(terminology_path, 'r', encoding='utf-8') as file:
+            terms = json.load(file).get('terms', [])
+        whisper_language = load_key("whisper.language")
+        language = load_key("whisper.detected_language") if whisper_language == 'auto' else whisper_language
+        index = TerminologyIndex(terms, word_boundary=language in load_key('language_split_with_space'))
+        INDEX_CACHE[terminology_path] = (mtime, index)
+        return index
+
+if __name__ == '__main__':
+    terms = [{'src': 'CNN', 'tgt': 'CNN', 'note': 'convolutional network'},
+             {'src': 'Machine Learning', 'tgt': '机器学习', 'note': 'AI technique'}]
+    index = TerminologyIndex(terms, word_boundary=True)
+    print(index.get_prompt('Machine learning with a CNN, not CNNs.'))
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+
+# ! You can modify your own weights here
+# Display width of a character relative to a half-width Latin letter, characters outside the table weigh 1
+CHAR_WEIGHT_RANGES = [
+    (0x4E00, 0x9FFF, 1.75),  # Chinese
+    (0x3040, 0x30FF, 1.75),  # Japanese
+    (0xAC00, 0xD7A3, 1.5),   # Korean
+    (0x1100, 0x11FF, 1.5),   # Korean Jamo
+    (0x0E00, 0x0E7F, 1),     # Thai
+    (0xFF01, 0xFF5E, 1.75),  # full-width symbols
+]
+WEIGHT_TABLE = np.ones(0x10000, dtype=np.float64)
+for start, end, weight in CHAR_WEIGHT_RANGES:
+    WEIGHT_TABLE[start:end + 1] = weight
+
+def char_weights(text: str) -> np.ndarray:
+    """Weight of every character of a text, looked up in one vectorized step"""
+    codes = np.frombuffer(str(text).encode('utf-32-le'), dtype=np.uint32)
+    weights = np.ones(len(codes), dtype=np.float64)
+    in_table = codes < len(WEIGHT_TABLE)
+    weights[in_table] = WEIGHT_TABLE[codes[in_table]]
+    return weights
+
+@lru_cache(maxsize=65536)
+def calc_len(text: str) -> float:
+    """Weighted subtitle length of a text, memoized because lines are measured again on every split attempt"""
+    return float(char_weights(text).sum())
+
+def calc_len_series(texts: pd.Series) -> pd.Series:
+    """Weighted lengths of a whole Series at once"""
+    texts = texts.astype(str)
+    lengths = texts.str.len().to_numpy()
+    weights = char_weights(''.join(texts))
+    # sum the weights of every text's slice of the joined string, empty texts weigh 0
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    sums = np.add.reduceat(weights, starts[lengths > 0]) if len(weights) else np.array([])
+    result = np.zeros(len(texts), dtype=np.float64)
+    result[lengths > 0] = sums
+    return pd.Series(result, index=texts.index)
+
+if __name__ == '__main__':
+    texts = pd.Series(['Hello world', '你好，世界', '', '안녕하세요', 'สวัสดี'])
+    print(calc_len_series(texts).tolist(), [calc_len(text) for text in texts])
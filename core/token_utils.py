@@ -0,0 +1,30 @@
+import math
+import re
+from functools import lru_cache
+
+try:
+    # Local tokenizer, falls back to calibrated per-script ratios when not installed
+    import tiktoken
+    ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    ENCODING = None
+
+# Calibrated tokens per character for common LLM tokenizers
+CJK_TOKENS_PER_CHAR = 0.8
+OTHER_TOKENS_PER_CHAR = 0.3
+CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff01-\uff5e]')
+
+@lru_cache(maxsize=8192)
+def estimate_tokens(text) -> int:
+    """Estimate the number of LLM tokens of a text"""
+    if not text:
+        return 0
+    text = str(text)
+    if ENCODING is not None:
+        return len(ENCODING.encode(text))
+    cjk_chars = len(CJK_PATTERN.findall(text))
+    return math.ceil(cjk_chars * CJK_TOKENS_PER_CHAR + (len(text) - cjk_chars) * OTHER_TOKENS_PER_CHAR)
+
+if __name__ == '__main__':
+    print(estimate_tokens("Hello world, this is a test."))
+    print(estimate_tokens("你好世界，这是一个测试。"))
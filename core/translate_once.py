@@ -1,5 +1,6 @@
-import os, sys
+import os, sys, re
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from threading import Lock
 from core.ask_gpt import ask_gpt
 from core.prompts_storage import generate_shared_prompt, get_prompt_faithfulness, get_prompt_expressiveness
 from rich.panel import Panel
@@ -7,44 +8,92 @@ from rich.console import Console
 from rich.table import Table
 from rich import box
 from core.config_utils import load_key
+from core.token_utils import estimate_tokens
 
 console = Console()
 
-def valid_translate_result(result: dict, required_keys: list, required_sub_keys: list):
-    # Check for the required key
-    if not all(key in result for key in required_keys):
-        return {"status": "error", "message": f"Missing required key(s): {', '.join(set(required_keys) - set(result.keys()))}"}
-    
-    # Check for required sub-keys in all items
-    for key in result:
-        if not all(sub_key in result[key] for sub_key in required_sub_keys):
-            return {"status": "error", "message": f"Missing required sub-key(s) in item {key}: {', '.join(set(required_sub_keys) - set(result[key].keys()))}"}
+# Lines at most this many tokens long are considered literal enough to keep the direct translation
+SHORT_LINE_TOKENS = 6
+REFLECTION_STATS = {'chunks': 0, 'skipped_calls': 0, 'reflected_lines': 0, 'skipped_lines': 0, 'saved_tokens': 0}
+REFLECTION_LOCK = Lock()
 
+def valid_translate_result(result: dict):
+    # Individual lines are checked by `is_valid_item` and repaired separately
+    if not isinstance(result, dict) or not result:
+        return {"status": "error", "message": "Response is not a JSON object with line keys"}
     return {"status": "success", "message": "Translation completed"}
 
-def translate_lines(lines, previous_content_prompt, after_cotent_prompt, things_to_note_prompt, summary_prompt, index = 0):
-    shared_prompt = generate_shared_prompt(previous_content_prompt, after_cotent_prompt, summary_prompt, things_to_note_prompt)
-
-    # Retry translation if the length of the original text and the translated text are not the same, or if the specified key is missing
-    def retry_translation(prompt, step_name):
-        def valid_faith(response_data):
-            return valid_translate_result(response_data, ['1'], ['direct'])
-        def valid_express(response_data):
-            return valid_translate_result(response_data, ['1'], ['free'])
-        for retry in range(3):
-            if step_name == 'faithfulness':
-                result = ask_gpt(prompt+retry* " ", response_json=True, valid_def=valid_faith, log_title=f'translate_{step_name}')
-            elif step_name == 'expressiveness':
-                result = ask_gpt(prompt+retry* " ", response_json=True, valid_def=valid_express, log_title=f'translate_{step_name}')
-            if len(lines.split('\n')) == len(result):
-                return result
-            if retry != 2:
-                console.print(f'[yellow]⚠️ {step_name.capitalize()} translation of block {index} failed, Retry...[/yellow]')
-        raise ValueError(f'[red]❌ {step_name.capitalize()} translation of block {index} failed after 3 retries. Please check `output/gpt_log/error.json` for more details.[/red]')
+def is_valid_item(item, required_sub_key: str):
+    return isinstance(item, dict) and isinstance(item.get(required_sub_key), str)
+
+def needs_reflection(origin: str, direct: str):
+    """Cheap heuristics predicting whether the free translation would differ from the direct one"""
+    origin, direct = origin.strip(), direct.strip()
+    if not re.search(r'[^\W\d_]', origin):  # numbers and symbols only
+        return False
+    if origin.lower() == direct.lower():  # names, UI strings and terms kept verbatim
+        return False
+    return estimate_tokens(origin) > SHORT_LINE_TOKENS
+
+def reset_reflection_stats():
+    """Start counting a new translation run, the stats live as long as the process"""
+    with REFLECTION_LOCK:
+        for key in REFLECTION_STATS:
+            REFLECTION_STATS[key] = 0
+
+def record_reflection(reflected_lines, skipped_lines, saved_tokens):
+    with REFLECTION_LOCK:
+        REFLECTION_STATS['chunks'] += 1
+        REFLECTION_STATS['skipped_calls'] += 0 if reflected_lines else 1
+        REFLECTION_STATS['reflected_lines'] += reflected_lines
+        REFLECTION_STATS['skipped_lines'] += skipped_lines
+        REFLECTION_STATS['saved_tokens'] += saved_tokens
+
+def print_reflection_report():
+    with REFLECTION_LOCK:
+        stats = dict(REFLECTION_STATS)
+    if not stats['chunks']:
+        return
+    console.print(Panel(
+        f"Expressiveness calls skipped: {stats['skipped_calls']}/{stats['chunks']}\n"
+        f"Lines reflected: {stats['reflected_lines']}, kept as direct translation: {stats['skipped_lines']}\n"
+        f"Estimated tokens saved: {stats['saved_tokens']}",
+        title="Adaptive Reflection", border_style="cyan"))
+
+def translate_lines(lines, previous_content_prompt, after_cotent_prompt, things_to_note_prompt, summary_prompt, index = 0, reference_prompt = None):
+    shared_prompt = generate_shared_prompt(previous_content_prompt, after_cotent_prompt, summary_prompt, things_to_note_prompt, reference_prompt)
+    line_splits = lines.split('\n')
+    all_line_numbers = list(range(1, len(line_splits) + 1))
+
+    # Ask for the given lines once, then re-request only the missing or malformed lines with their neighbouring lines as context.
+    # Requests are numbered from 1, the returned result is keyed by the line number in `lines`.
+    def translate_with_repair(build_prompt, step_name, required_sub_key, line_numbers):
+        result = {}
+        pending = line_numbers
+        prompt_context = shared_prompt
+        for attempt in range(4):
+            if attempt > 0:
+                console.print(f'[yellow]⚠️ {step_name.capitalize()} translation of block {index} is missing line(s) {", ".join(map(str, pending))}, repairing...[/yellow]')
+                prompt_context = generate_shared_prompt(
+                    line_splits[max(0, pending[0] - 2):pending[0] - 1] or previous_content_prompt,
+                    line_splits[pending[-1]:pending[-1] + 1] or after_cotent_prompt,
+                    summary_prompt, things_to_note_prompt, reference_prompt)
+            prompt = build_prompt(pending, prompt_context) + max(0, attempt - 1) * " "
+            response = ask_gpt(prompt, response_json=True, valid_def=valid_translate_result, log_title=f'translate_{step_name}')
+            for request_key, line_number in zip(map(str, range(1, len(pending) + 1)), pending):
+                if is_valid_item(response.get(request_key), required_sub_key):
+                    result[line_number] = response[request_key]
+            pending = [line_number for line_number in pending if line_number not in result]
+            if not pending:
+                return {str(line_number): result[line_number] for line_number in line_numbers}
+        raise ValueError(f'[red]❌ {step_name.capitalize()} translation of block {index} failed after 3 repairs. Please check `output/gpt_log/error.json` for more details.[/red]')
 
     ## Step 1: Faithful to the Original Text
-    prompt1 = get_prompt_faithfulness(lines, shared_prompt)
-    faith_result = retry_translation(prompt1, 'faithfulness')
+    def build_faithfulness_prompt(line_numbers, prompt_context):
+        return get_prompt_faithfulness('\n'.join(line_splits[n - 1] for n in line_numbers), prompt_context)
+    faith_result = translate_with_repair(build_faithfulness_prompt, 'faithfulness', 'direct', all_line_numbers)
+    for i in faith_result:
+        faith_result[i].setdefault("origin", line_splits[int(i) - 1])
 
     for i in faith_result:
         faith_result[i]["direct"] = faith_result[i]["direct"].replace('\n', ' ')
@@ -67,8 +116,28 @@ def translate_lines(lines, previous_content_prompt, after_cotent_prompt, things_
         return translate_result, lines
 
     ## Step 2: Express Smoothly  
-    prompt2 = get_prompt_expressiveness(faith_result, lines, shared_prompt)
-    express_result = retry_translation(prompt2, 'expressiveness')
+    def build_expressiveness_prompt(line_numbers, prompt_context):
+        sub_faith_result = {str(i): faith_result[str(n)] for i, n in enumerate(line_numbers, 1)}
+        return get_prompt_expressiveness(sub_faith_result, '\n'.join(line_splits[n - 1] for n in line_numbers), prompt_context)
+
+    if load_key('adaptive_reflection'):
+        reflect_line_numbers = [n for n in all_line_numbers if needs_reflection(line_splits[n - 1], faith_result[str(n)]["direct"])]
+    else:
+        reflect_line_numbers = all_line_numbers
+
+    express_result = {key: {"free": value["direct"]} for key, value in faith_result.items()}
+    if reflect_line_numbers:
+        express_result.update(translate_with_repair(build_expressiveness_prompt, 'expressiveness', 'free', reflect_line_numbers))
+    if len(reflect_line_numbers) < len(all_line_numbers):
+        skipped_line_numbers = [n for n in all_line_numbers if n not in reflect_line_numbers]
+        saved_tokens = estimate_tokens(build_expressiveness_prompt(all_line_numbers, shared_prompt))
+        if reflect_line_numbers:
+            saved_tokens -= estimate_tokens(build_expressiveness_prompt(reflect_line_numbers, shared_prompt))
+        saved_tokens += sum(3 * estimate_tokens(faith_result[str(n)]["direct"]) for n in skipped_line_numbers)
+        console.print(f'[cyan]💡 Block {index}: kept direct translation for line(s) {", ".join(map(str, skipped_line_numbers))}[/cyan]')
+    else:
+        saved_tokens = 0
+    record_reflection(len(reflect_line_numbers), len(all_line_numbers) - len(reflect_line_numbers), saved_tokens)
 
     table = Table(title="Translation Results", show_header=False, box=box.ROUNDED)
     table.add_column("Translations", style="bold")
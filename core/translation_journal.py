@@ -0,0 +1,43 @@
+import os, sys, json, hashlib
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from threading import Lock
+
+JOURNAL_FILE = 'output/log/translation_journal.jsonl'
+JOURNAL_LOCK = Lock()
+
+def get_hash(value):
+    return hashlib.md5(json.dumps(value, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+def get_chunk_key(chunk, context):
+    """Source hash plus context hash, a chunk is reused only when both are unchanged"""
+    return f'{get_hash(chunk)}:{get_hash(context)}'
+
+def load_journal(journal_path=JOURNAL_FILE):
+    """Read committed chunks as {key: entry}, later entries win and a torn last line is ignored"""
+    journal = {}
+    if not os.path.exists(journal_path):
+        return journal
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            # keep the journal in commit order, a re-committed key moves to the end
+            journal.pop(entry['key'], None)
+            journal[entry['key']] = entry
+    return journal
+
+def append_journal(entry, journal_path=JOURNAL_FILE):
+    """Commit one entry, it is on disk before this returns"""
+    with JOURNAL_LOCK:
+        os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+        with open(journal_path, 'a+b') as f:
+            # start on a fresh line if the previous run died halfway through a write
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+            f.write((json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
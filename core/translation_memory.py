@@ -0,0 +1,171 @@
+import os, sys, re, json, zlib, hashlib, uuid
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from collections import defaultdict
+from threading import Lock
+import numpy as np
+from core.config_utils import load_key
+
+# MinHash over character 3-grams, works the same for languages with and without spaces
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+# LSH banding, two sentences become candidates when all rows of one band agree
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+MERSENNE_PRIME = (1 << 61) - 1
+_rng = np.random.RandomState(1)
+PERM_A = _rng.randint(1, 1 << 31, NUM_PERM).astype(np.uint64)
+PERM_B = _rng.randint(0, 1 << 31, NUM_PERM).astype(np.uint64)
+
+TM_LOCK = Lock()
+# Identifies the video being translated, its own translations are tracked by the journal and never reused for itself
+TM_SESSION_FILE = 'output/log/translation_memory_session.txt'
+
+def normalize_sentence(sentence):
+    return ' '.join(str(sentence).split()).casefold()
+
+def get_shingles(sentence):
+    text = normalize_sentence(sentence)
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+def get_minhash(shingles):
+    hashes = np.array([zlib.crc32(s.encode('utf-8')) for s in shingles], dtype=np.uint64)
+    # (a * x + b) mod p for every permutation and shingle, the minimum per permutation is the signature
+    return ((np.outer(hashes, PERM_A) + PERM_B) % MERSENNE_PRIME).min(axis=0)
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+def get_pair_key(src, tgt, terms_key):
+    return normalize_sentence(src), str(tgt), terms_key
+
+def get_shard_path(path, tgt_lang):
+    """Every target language appends to its own file next to `path`, the extra languages are translated in parallel processes"""
+    root, ext = os.path.splitext(path)
+    language = re.sub(r'[\\/:*?"<>|\s]+', '_', tgt_lang)
+    return f'{root}.{language}{ext}'
+
+def get_terms_key(terms):
+    """Terminology version of a sentence, the exact translation is only reused with the same matched (src, tgt) terms.
+    Numbering and notes of the terms differ between videos and are left out."""
+    pairs = sorted({(str(term['src']).lower(), str(term['tgt'])) for term in terms or []})
+    # lines without terms keep the key of an empty prompt, which earlier entries were stored with
+    return hashlib.md5((json.dumps(pairs, ensure_ascii=False) if pairs else '').encode('utf-8')).hexdigest()
+
+class TranslationMemory:
+    """Persistent (source, target) sentence pairs of one language pair, shared across videos"""
+
+    def __init__(self, path, src_lang, tgt_lang, session=None):
+        self.path = path
+        self.src_lang = src_lang
+        self.tgt_lang = tgt_lang
+        self.session = session
+        # newest entry per (sentence, terms key) for exact reuse
+        self.exact = {}
+        # newest entry per sentence with its 3-grams, the LSH buckets hold indexes into this list
+        self.sentences = []
+        self.sentence_ids = {}
+        self.buckets = defaultdict(list)
+        # pairs this video already stored, a rerun must not append them again
+        self.stored = set()
+        self.shard_path = get_shard_path(path, tgt_lang)
+        # entries written before the memory was sharded by language stay in `path`
+        for file in (path, self.shard_path):
+            if not os.path.exists(file):
+                continue
+            with open(file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if entry['src_lang'] != src_lang or entry['tgt_lang'] != tgt_lang:
+                        continue
+                    # a rerun of the same video must not find its own earlier output
+                    if session is not None and entry.get('session') == session:
+                        self.stored.add(get_pair_key(entry['src'], entry['tgt'], entry['terms']))
+                    else:
+                        self._index(entry)
+
+    def _index(self, entry):
+        """Keep the newest translation of every sentence, entries repeated by reruns are indexed once"""
+        sentence = normalize_sentence(entry['src'])
+        self.exact[(sentence, entry['terms'])] = entry
+        if sentence in self.sentence_ids:
+            idx = self.sentence_ids[sentence]
+            self.sentences[idx] = (self.sentences[idx][0], entry)
+            return
+        idx = len(self.sentences)
+        self.sentence_ids[sentence] = idx
+        shingles = get_shingles(entry['src'])
+        self.sentences.append((shingles, entry))
+        signature = get_minhash(shingles)
+        for band in range(BANDS):
+            self.buckets[(band, signature[band * ROWS:(band + 1) * ROWS].tobytes())].append(idx)
+
+    def lookup_exact(self, sentence, terms_key):
+        entry = self.exact.get((normalize_sentence(sentence), terms_key))
+        return None if entry is None else entry['tgt']
+
+    def lookup_fuzzy(self, sentence, threshold, limit=3):
+        """Most similar stored pairs as [(score, entry)], scored by the exact Jaccard of their 3-grams"""
+        shingles = get_shingles(sentence)
+        signature = get_minhash(shingles)
+        candidates = set()
+        for band in range(BANDS):
+            candidates.update(self.buckets.get((band, signature[band * ROWS:(band + 1) * ROWS].tobytes()), ()))
+        scored = [(jaccard(shingles, self.sentences[idx][0]), self.sentences[idx][1]) for idx in candidates]
+        scored = [item for item in scored if item[0] >= threshold]
+        return sorted(scored, key=lambda item: -item[0])[:limit]
+
+    def add(self, pairs):
+        """Store (source, target, terms_key) pairs for later videos, pairs this video stored before are skipped"""
+        with TM_LOCK:
+            entries = []
+            for src, tgt, terms_key in pairs:
+                pair_key = get_pair_key(src, tgt, terms_key)
+                if str(src).strip() and str(tgt).strip() and pair_key not in self.stored:
+                    self.stored.add(pair_key)
+                    entries.append({'src': src, 'tgt': tgt, 'src_lang': self.src_lang, 'tgt_lang': self.tgt_lang, 'terms': terms_key, 'session': self.session})
+            if not entries:
+                return
+            os.makedirs(os.path.dirname(self.shard_path) or '.', exist_ok=True)
+            with open(self.shard_path, 'a', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def get_reference_prompt(self, lines, threshold, limit=3):
+        """Similar earlier translations of the given lines, as few-shot references for the prompt"""
+        references = {}
+        for line in lines:
+            for score, entry in self.lookup_fuzzy(line, threshold, limit):
+                references.setdefault(entry['src'], entry['tgt'])
+        if not references:
+            return None
+        return '\n'.join(f'"{src}" -> "{tgt}"' for src, tgt in list(references.items())[:limit * 2])
+
+def get_session():
+    """Id of the video in `output`, created on its first translation and kept across reruns"""
+    if not os.path.exists(TM_SESSION_FILE):
+        os.makedirs(os.path.dirname(TM_SESSION_FILE), exist_ok=True)
+        with open(TM_SESSION_FILE, 'w', encoding='utf-8') as f:
+            f.write(uuid.uuid4().hex)
+    with open(TM_SESSION_FILE, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
+def load_translation_memory():
+    """Translation memory of the current language pair without the current video's own entries, or None when disabled"""
+    tm_set = load_key("translation_memory")
+    if not tm_set["enable"]:
+        return None
+    whisper_language = load_key("whisper.language")
+    src_lang = load_key("whisper.detected_language") if whisper_language == 'auto' else whisper_language
+    return TranslationMemory(tm_set["path"], src_lang, load_key("target_language"), get_session())
+
+if __name__ == '__main__':
+    TranslationMemory('/tmp/tm_demo.jsonl', 'en', 'zh', 'previous video').add(
+        [("Welcome back to the channel, today we talk about GPUs.", "欢迎回到频道，今天我们聊聊GPU。", get_terms_key(None))])
+    tm = TranslationMemory('/tmp/tm_demo.jsonl', 'en', 'zh', 'current video')
+    print(tm.lookup_exact("welcome back to the channel,  today we talk about GPUs.", get_terms_key(None)))
+    print(tm.lookup_fuzzy("Welcome back to the channel, today we talk about CPUs.", 0.6))
@@ -62,14 +62,23 @@ def process_text():
     with st.spinner("分割长句中..."):
         step3_1_spacy_split.split_by_spacy()
         step3_2_splitbymeaning.split_sentences_by_meaning()
-    with st.spinner("总结和翻译中..."):
-        step4_1_summarize.get_summary()
-        if load_key("pause_before_translate"):
-            input("⚠️ 翻译前暂停。请前往 `output/log/terminology.json` 编辑术语。完成后按回车继续...")
-        step4_2_translate_all.translate_all()
-    with st.spinner("处理和对齐字幕中..."):
-        step5_splitforsub.split_for_sub_main()
-        step6_generate_final_timeline.align_timestamp_main()
+    try:
+        with st.spinner("总结和翻译中..."):
+            step4_1_summarize.get_summary()
+            if load_key("pause_before_translate"):
+                input("⚠️ 翻译前暂停。请前往 `output/log/terminology.json` 编辑术语。完成后按回车继续...")
+            # a run that was stopped before may have left its extra languages behind
+            multi_target.cancel_extra_targets()
+            multi_target.start_extra_targets()
+            step4_2_translate_all.translate_all()
+        with st.spinner("处理和对齐字幕中..."):
+            step5_splitforsub.split_for_sub_main()
+            multi_target.wait_extra_targets()
+            step6_generate_final_timeline.align_timestamp_main()
+    except BaseException:
+        # Streamlit also stops a rerun script by raising, the extra languages must not outlive it
+        multi_target.cancel_extra_targets()
+        raise
     with st.spinner("将字幕合并到视频中..."):
         step7_merge_sub_to_vid.merge_subtitles_to_video()
     
@@ -15,6 +15,7 @@ from core import (
     
     # Subtitle Timeline & Merging 🎬
     step6_generate_final_timeline,
+    multi_target,
     step7_merge_sub_to_vid,
     
     # Audio Generation & Processing 🎵